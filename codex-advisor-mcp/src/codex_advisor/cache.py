@@ -0,0 +1,106 @@
+"""Response cache - 基于 SQLite 的内容寻址 Codex 结果缓存"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+# 环境变量配置
+CODEX_CACHE = os.getenv("CODEX_CACHE", "true").lower() == "true"  # 是否启用缓存
+CODEX_CACHE_PATH = os.getenv(
+    "CODEX_CACHE_PATH", str(Path.home() / ".cache" / "codex-advisor" / "responses.sqlite3")
+)
+CODEX_CACHE_TTL = int(os.getenv("CODEX_CACHE_TTL", "604800"))  # 过期时间（秒），默认 7 天
+CODEX_CACHE_MAX_ENTRIES = int(os.getenv("CODEX_CACHE_MAX_ENTRIES", "500"))  # 超出后按 LRU 淘汰
+
+CACHE_MODES = ("use", "bypass", "refresh")
+
+
+def cache_key(prompt: str, cmd: list[str]) -> str:
+    """按规范化后的提示词和 CLI 命令（模型、推理程度等参数）计算缓存键。"""
+    normalized = "\n".join(" ".join(line.split()) for line in prompt.strip().splitlines())
+    return hashlib.sha256(json.dumps([cmd, normalized]).encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite 结果缓存，支持 TTL 和按最近使用时间的容量淘汰。"""
+
+    def __init__(self, path: str = CODEX_CACHE_PATH, ttl: int = CODEX_CACHE_TTL, max_entries: int = CODEX_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+
+    @contextmanager
+    def _connect(self):
+        """打开连接并在一个事务中执行，结束后关闭。"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                    " created REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.counters["expired"] += 1
+                row = None
+            if not row:
+                self.counters["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.counters["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict[str, Any]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            evicted = conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.counters["stores"] += 1
+        self.counters["evictions"] += max(evicted, 0)
+
+    def stats(self) -> dict[str, Any]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "path": self.path,
+        }
+
+
+_cache: ResponseCache | None = None
+
+
+def get_cache() -> ResponseCache:
+    """获取进程级缓存实例。"""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
@@ -1,10 +1,19 @@
-"""Codex CLI client - subprocess 直连调用 Codex CLI"""
+"""Codex CLI client - async subprocess 直连调用 Codex CLI"""
+import asyncio
+import hashlib
 import json
 import os
 import re
-import subprocess
+import signal
 import tempfile
-from typing import Any
+import time
+from typing import Any, Awaitable, Callable
+
+from .cache import CACHE_MODES, CODEX_CACHE, cache_key, get_cache
+from .hedging import CODEX_HEDGE, get_hedger
+from .ratelimit import get_limiter
+from .sessions import DEFAULT_CONVERSATION, get_registry
+from .singleflight import get_flights
 
 # 环境变量配置
 CODEX_TIMEOUT = int(os.getenv("CODEX_TIMEOUT", "1800"))  # 超时（秒），默认 30 分钟
@@ -13,6 +22,15 @@ CODEX_SANDBOX = os.getenv("CODEX_SANDBOX", "read-only")  # 沙箱模式: read-on
 CODEX_REASONING_EFFORT = os.getenv("CODEX_REASONING_EFFORT")  # 推理程度: minimal, low, medium, high
 CODEX_SKIP_GIT_CHECK = os.getenv("CODEX_SKIP_GIT_CHECK", "true").lower() == "true"  # 跳过 git 仓库检查
 CODEX_EXTRA_FLAGS = os.getenv("CODEX_EXTRA_FLAGS", "")  # 额外 CLI 参数
+CODEX_MAX_CONCURRENCY = int(os.getenv("CODEX_MAX_CONCURRENCY", "4"))  # 同时运行的 Codex 进程上限
+CODEX_BATCH_CONCURRENCY = int(os.getenv("CODEX_BATCH_CONCURRENCY", str(CODEX_MAX_CONCURRENCY)))  # 单个批量请求的并发上限
+CODEX_DELTA_PROMPTS = os.getenv("CODEX_DELTA_PROMPTS", "true").lower() == "true"  # 恢复会话时只发送变化部分
+CODEX_SINGLE_FLIGHT = os.getenv("CODEX_SINGLE_FLIGHT", "true").lower() == "true"  # 合并进行中的相同调用
+CODEX_REPAIR = os.getenv("CODEX_REPAIR", "true").lower() == "true"  # 输出不符合 schema 时在同一会话中请求修复
+CODEX_STREAM = os.getenv("CODEX_STREAM", "true").lower() == "true"  # 使用 --json 事件流上报进度
+STREAM_LINE_LIMIT = 16 * 1024 * 1024  # 事件流单行上限
+
+EventCallback = Callable[[dict[str, Any]], Awaitable[None]]
 
 # 系统角色提示（可通过环境变量自定义）
 DEFAULT_SYSTEM_PROMPT = """You are a Socratic technical mentor. Your role is NOT to give direct answers or recommendations. \
@@ -26,8 +44,15 @@ IMPORTANT: Do NOT recommend a specific solution. Help the user think more deeply
 
 CODEX_SYSTEM_PROMPT = os.getenv("CODEX_SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
 
-# 会话 ID 存储
-_last_session_id: str | None = None
+# 并发控制（首次使用时创建，绑定到当前事件循环）
+_semaphore: asyncio.Semaphore | None = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, CODEX_MAX_CONCURRENCY))
+    return _semaphore
 
 
 def get_codex_cmd(session_id: str | None = None, resume_last: bool = False) -> list[str]:
@@ -67,6 +92,7 @@ def extract_session_id(output: str) -> str | None:
         r"session[_-]?id[:\s]+([a-f0-9-]+)",
         r'"conversationId":\s*"([^"]+)"',
         r'"threadId":\s*"([^"]+)"',
+        r'"thread_id":\s*"([^"]+)"',
     ]
     for pattern in patterns:
         if match := re.search(pattern, output, re.IGNORECASE):
@@ -104,14 +130,8 @@ def build_prompt(payload: dict[str, Any]) -> str:
 
     if candidate_plans:
         lines.extend(["", "Candidate plans to examine:"])
-        for idx, plan in enumerate(candidate_plans, start=1):
-            name = plan.get("name") or f"plan-{idx}"
-            desc = plan.get("description") or ""
-            lines.append(f"- {name}: {desc}")
-            if assumptions := plan.get("assumptions"):
-                lines.append(f"  assumptions: {', '.join(assumptions)}")
-            if suspicions := plan.get("suspicions"):
-                lines.append(f"  concerns: {', '.join(suspicions)}")
+        for name, plan in _named_plans(candidate_plans).items():
+            lines.extend(_plan_lines(name, plan))
 
     lines.extend([
         "",
@@ -131,161 +151,617 @@ def build_prompt(payload: dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
-def write_schema_file() -> str:
-    """写入 JSON Schema 文件。"""
-    schema = {
-        "type": "object",
-        "additionalProperties": False,
-        "properties": {
-            "socratic_questions": {"type": "array", "items": {"type": "string"}},
-            "assumption_challenges": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "assumption": {"type": "string"},
-                        "why_problematic": {"type": "string"},
-                        "what_if_wrong": {"type": "string"},
-                    },
-                    "required": ["assumption", "why_problematic", "what_if_wrong"],
-                },
-            },
-            "contradictions_revealed": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "conflict": {"type": "string"},
-                        "tension_between": {"type": "string"},
-                        "question_to_resolve": {"type": "string"},
-                    },
-                    "required": ["conflict", "tension_between", "question_to_resolve"],
+def _named_plans(candidate_plans: list[dict]) -> dict[str, dict]:
+    return {plan.get("name") or f"plan-{idx}": plan for idx, plan in enumerate(candidate_plans, start=1)}
+
+
+def _plan_lines(name: str, plan: dict) -> list[str]:
+    lines = [f"- {name}: {plan.get('description') or ''}"]
+    if assumptions := plan.get("assumptions"):
+        lines.append(f"  assumptions: {', '.join(assumptions)}")
+    if suspicions := plan.get("suspicions"):
+        lines.append(f"  concerns: {', '.join(suspicions)}")
+    return lines
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+_SCALAR_FIELDS = ("problem", "context", "focus_areas", "non_goals")
+
+
+def prompt_state(payload: dict[str, Any], previous: dict[str, Any] | None = None) -> dict[str, Any]:
+    """记录本轮之后会话已经看到的内容（字段摘要），用于下一轮构建增量提示词。"""
+    previous = previous or {}
+    state: dict[str, Any] = {field: _digest(payload.get(field) or None) for field in _SCALAR_FIELDS}
+    state["phase"] = payload.get("phase") or "initial"
+    state["questions"] = sorted(set(previous.get("questions", [])) | {
+        _digest(q) for q in payload.get("questions_for_codex") or []
+    })
+    state["plans"] = {
+        **previous.get("plans", {}),
+        **{name: _digest(plan) for name, plan in _named_plans(payload.get("candidate_plans") or []).items()},
+    }
+    return state
+
+
+def build_delta_prompt(payload: dict[str, Any], sent: dict[str, Any]) -> str:
+    """为恢复的会话构建增量提示词：只包含上一轮之后新增或变化的内容。
+
+    系统提示、未变化的问题描述和方案、JSON 格式说明都已在会话上下文中，不再重复发送。
+    """
+    lines = ["Follow-up on the same design decision. Only what changed since your last answer is listed below."]
+
+    for field in _SCALAR_FIELDS:
+        value = payload.get(field) or None
+        if value and _digest(value) != sent.get(field):
+            lines.append(f"- updated {field}: {', '.join(value) if isinstance(value, list) else value}")
+
+    phase = payload.get("phase") or "initial"
+    if phase != sent.get("phase"):
+        lines.append(f"- conversation_phase: {sent.get('phase', 'initial')} -> {phase}")
+
+    seen_questions = set(sent.get("questions", []))
+    if new_questions := [q for q in payload.get("questions_for_codex") or [] if _digest(q) not in seen_questions]:
+        lines.append("- new user_questions:")
+        lines.extend(f"  • {q}" for q in new_questions)
+
+    seen_plans = sent.get("plans", {})
+    changed = []
+    for name, plan in _named_plans(payload.get("candidate_plans") or []).items():
+        if name not in seen_plans:
+            changed.extend(_plan_lines(name, plan) + ["  (new plan)"])
+        elif seen_plans[name] != _digest(plan):
+            changed.extend(_plan_lines(name, plan) + ["  (modified plan)"])
+    if changed:
+        lines.extend(["", "Candidate plans added or modified:"])
+        lines.extend(changed)
+
+    if len(lines) == 1:
+        lines.append("- No new input; continue deepening the examination from where you left off.")
+
+    lines.extend([
+        "",
+        "Respond with ONLY a JSON object using EXACTLY the same keys as your previous answer. "
+        "Keep guiding thinking; do not give direct recommendations.",
+    ])
+    return "\n".join(lines)
+
+
+# Codex 输出的 JSON Schema，同时用于本地校验
+ADVISOR_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties": {
+        "socratic_questions": {"type": "array", "items": {"type": "string"}},
+        "assumption_challenges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "assumption": {"type": "string"},
+                    "why_problematic": {"type": "string"},
+                    "what_if_wrong": {"type": "string"},
                 },
+                "required": ["assumption", "why_problematic", "what_if_wrong"],
             },
-            "unexplored_paths": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "path": {"type": "string"},
-                        "why_worth_exploring": {"type": "string"},
-                        "key_question": {"type": "string"},
-                    },
-                    "required": ["path", "why_worth_exploring", "key_question"],
+        },
+        "contradictions_revealed": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "conflict": {"type": "string"},
+                    "tension_between": {"type": "string"},
+                    "question_to_resolve": {"type": "string"},
                 },
+                "required": ["conflict", "tension_between", "question_to_resolve"],
             },
-            "deeper_inquiry": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "question": {"type": "string"},
-                        "what_it_reveals": {"type": "string"},
-                    },
-                    "required": ["question", "what_it_reveals"],
+        },
+        "unexplored_paths": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "path": {"type": "string"},
+                    "why_worth_exploring": {"type": "string"},
+                    "key_question": {"type": "string"},
                 },
+                "required": ["path", "why_worth_exploring", "key_question"],
             },
-            "guided_insights": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "observation": {"type": "string"},
-                        "implication": {"type": "string"},
-                    },
-                    "required": ["observation", "implication"],
+        },
+        "deeper_inquiry": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "question": {"type": "string"},
+                    "what_it_reveals": {"type": "string"},
                 },
+                "required": ["question", "what_it_reveals"],
             },
-            "synthesis": {
+        },
+        "guided_insights": {
+            "type": "array",
+            "items": {
                 "type": "object",
                 "additionalProperties": False,
                 "properties": {
-                    "key_tensions": {"type": "string"},
-                    "critical_unknowns": {"type": "string"},
-                    "next_thinking_steps": {"type": "string"},
+                    "observation": {"type": "string"},
+                    "implication": {"type": "string"},
                 },
-                "required": ["key_tensions", "critical_unknowns", "next_thinking_steps"],
+                "required": ["observation", "implication"],
             },
         },
-        "required": [
-            "socratic_questions", "assumption_challenges", "contradictions_revealed",
-            "unexplored_paths", "deeper_inquiry", "guided_insights", "synthesis",
-        ],
-    }
+        "synthesis": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "key_tensions": {"type": "string"},
+                "critical_unknowns": {"type": "string"},
+                "next_thinking_steps": {"type": "string"},
+            },
+            "required": ["key_tensions", "critical_unknowns", "next_thinking_steps"],
+        },
+    },
+    "required": [
+        "socratic_questions", "assumption_challenges", "contradictions_revealed",
+        "unexplored_paths", "deeper_inquiry", "guided_insights", "synthesis",
+    ],
+}
+
+
+def write_schema_file() -> str:
+    """写入 JSON Schema 文件。"""
     tmp = tempfile.NamedTemporaryFile("w", delete=False, suffix=".schema.json")
-    json.dump(schema, tmp)
+    json.dump(ADVISOR_SCHEMA, tmp)
     tmp.close()
     return tmp.name
 
 
-def call_codex(payload: dict[str, Any]) -> dict[str, Any]:
-    """调用 Codex CLI 并返回结果。"""
-    global _last_session_id
+_TYPES = {"object": dict, "array": list, "string": str}
+
+
+def validate_schema(value: Any, schema: dict[str, Any], path: str = "$") -> list[str]:
+    """按 JSON Schema 子集（type/properties/required/additionalProperties/items）校验，返回错误列表。"""
+    expected = schema.get("type")
+    if expected and not isinstance(value, _TYPES[expected]):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+
+    errors = []
+    if expected == "object":
+        properties = schema.get("properties", {})
+        errors.extend(f"{path}: missing required key '{key}'" for key in schema.get("required", []) if key not in value)
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate_schema(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected key '{key}'")
+    elif expected == "array" and "items" in schema:
+        for idx, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{idx}]"))
+    return errors
+
+
+def parse_advisor_output(content: str) -> Any:
+    """解析 Codex 输出，容忍代码块包裹和前后多余文字，失败返回 None。"""
+    content = content.strip()
+    candidates = [content]
+    if fenced := re.search(r"```(?:json)?\s*(.*?)```", content, re.DOTALL):
+        candidates.append(fenced.group(1).strip())
+    if (start := content.find("{")) != -1 and (end := content.rfind("}")) > start:
+        candidates.append(content[start:end + 1])
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
 
-    session_id = payload.get("session_id")
-    resume_last = payload.get("resume_last", False)
-    is_resume = bool(session_id or resume_last)
 
-    prompt = build_prompt(payload)
-    cmd = get_codex_cmd(session_id=session_id, resume_last=resume_last)
+def build_repair_prompt(errors: list[str]) -> str:
+    """构建修复轮提示词：只要求按 schema 重新输出上一轮的回答。"""
+    listed = "\n".join(f"- {err}" for err in errors[:20])
+    return (
+        "Your previous answer was not valid JSON for the required schema:\n"
+        f"{listed}\n\n"
+        "Return the same content as ONLY a valid JSON object matching this schema "
+        "(no prose, no code fences):\n"
+        f"{json.dumps(ADVISOR_SCHEMA, separators=(',', ':'))}"
+    )
+
+
+# 校验与修复统计（进程级）
+_validation_stats = {
+    "validated": 0,
+    "valid": 0,
+    "invalid": 0,
+    "repairs_attempted": 0,
+    "repairs_succeeded": 0,
+    "repair_seconds": 0.0,
+}
+
+
+def validation_stats() -> dict[str, Any]:
+    """返回本进程的输出校验与修复统计。"""
+    stats = dict(_validation_stats)
+    stats["repair_seconds"] = round(stats["repair_seconds"], 3)
+    return stats
+
+
+_QUESTIONS_RE = re.compile(r'"socratic_questions"\s*:\s*\[')
+_decoder = json.JSONDecoder()
+
+
+def extract_partial_questions(text: str) -> list[str]:
+    """从尚未输出完整的 JSON 文本中提取 socratic_questions 里已完整的问题。"""
+    if not (match := _QUESTIONS_RE.search(text)):
+        return []
+    questions = []
+    pos = match.end()
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] != '"':
+            break
+        try:
+            value, pos = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        questions.append(value)
+    return questions
+
+
+def _agent_message_text(event: dict[str, Any], current: str) -> str | None:
+    """从 --json 事件中取出 agent 消息的最新全文，非消息事件返回 None。"""
+    if isinstance(item := event.get("item"), dict):
+        if item.get("type") == "agent_message" and isinstance(item.get("text"), str):
+            return item["text"]
+        return None
+    msg = event.get("msg")
+    if not isinstance(msg, dict):
+        return None
+    if msg.get("type") == "agent_message_delta":
+        return current + (msg.get("delta") or "")
+    if msg.get("type") == "agent_message":
+        return msg.get("message") or current
+    return None
 
-    schema_path = output_path = None
-    if not is_resume:
-        schema_path = write_schema_file()
-        fd, output_path = tempfile.mkstemp(suffix=".json")
-        os.close(fd)
-        cmd += ["--output-schema", schema_path, "-o", output_path]
 
-    try:
-        proc = subprocess.run(
-            cmd + [prompt],
-            text=True,
-            capture_output=True,
-            timeout=CODEX_TIMEOUT,
-        )
+async def _read_events(stream: asyncio.StreamReader, on_event: EventCallback) -> tuple[str, str]:
+    """逐行读取 --json 事件流，上报新完成的问题，返回 (完整 stdout, 最终 agent 消息)。"""
+    lines: list[str] = []
+    message = ""
+    questions: list[str] = []
+    async for raw in stream:
+        line = raw.decode(errors="replace")
+        lines.append(line)
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(event, dict):
+            continue
 
-        if proc.returncode != 0:
-            return {"error": "codex_cli_failed", "exit_code": proc.returncode, "stderr": proc.stderr[-2000:]}
+        new_questions: list[str] = []
+        if (text := _agent_message_text(event, message)) is not None:
+            message = text
+            found = extract_partial_questions(message)
+            new_questions = found[len(questions):]
+            questions.extend(new_questions)
 
-        # 读取输出
-        content = ""
-        if output_path and os.path.exists(output_path):
-            with open(output_path) as f:
-                content = f.read().strip()
-        elif is_resume:
-            content = proc.stdout.strip()
+        event_type = event.get("type") or (event.get("msg") or {}).get("type") or "unknown"
+        await on_event({"event": event_type, "new_questions": new_questions, "questions_so_far": len(questions)})
+    return "".join(lines), message
 
-        if not content:
-            return {"error": "codex_output_empty", "raw_output": proc.stdout}
 
-        # 解析 JSON
+async def _kill(proc: asyncio.subprocess.Process) -> None:
+    """终止仍在运行的 Codex 进程组（包括它启动的命令）并回收。"""
+    if proc.returncode is None:
         try:
-            result = json.loads(content)
-        except json.JSONDecodeError:
-            result = {"raw_text": content}
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
 
-        # 提取会话 ID
-        if new_id := extract_session_id(proc.stdout) or extract_session_id(proc.stderr):
-            _last_session_id = new_id
-            result["session_id"] = new_id
-        elif session_id:
-            result["session_id"] = session_id
-        elif _last_session_id:
-            result["session_id"] = _last_session_id
 
+async def call_codex_async(payload: dict[str, Any], on_event: EventCallback | None = None) -> dict[str, Any]:
+    """异步调用 Codex CLI 并返回结果。
+
+    同时运行的 Codex 进程数受 CODEX_MAX_CONCURRENCY 限制，启动速率和主机级会话数
+    受 CODEX_RATE_LIMIT_* 限制（超出时排队）；超时或调用方取消时会杀掉子进程。
+
+    提供 on_event 且 CODEX_STREAM 开启时以 --json 运行，每个事件回调一次，
+    并附带 socratic_questions 中新完成的问题；最终结果仍以 schema 校验后的输出为准。
+
+    新会话的成功结果按提示词和命令参数缓存，payload["cache"] 控制缓存行为：
+    use（默认，命中即返回）、bypass（不读不写）、refresh（忽略旧结果并重新写入）。
+    恢复会话的调用依赖会话上下文，不参与缓存。缓存中不保存 session_id，命中的结果带
+    resumable: false，不能用于恢复会话（否则会接上填充缓存的那个调用方的会话）。
+
+    会话按 payload["conversation_id"] 隔离：resume_last 只会恢复同一 conversation
+    最近的会话，不会接上其他调用方的会话。
+
+    payload["hedge"]（默认 CODEX_HEDGE）开启时，新会话耗时超过近期延迟分位数仍未完成
+    会再发起一个相同的请求，先成功者胜出，另一个进程被杀掉。恢复会话不对冲。
+
+    CODEX_SINGLE_FLIGHT 开启时，同一 conversation 中命令和提示词完全相同的并发调用共享同一次执行，
+    后到的调用拿到结果副本（带 coalesced: true），不会收到流式事件。不同 conversation 不合并，
+    以免两个 conversation 记录到同一个会话。
+    """
+    cache_mode = payload.get("cache") or "use"
+    if cache_mode not in CACHE_MODES:
+        return {"error": "invalid_cache_mode", "message": f"Unknown cache mode '{cache_mode}' (expected one of {', '.join(CACHE_MODES)})"}
+
+    conversation = payload.get("conversation_id") or DEFAULT_CONVERSATION
+    registry = get_registry()
+
+    session_id = payload.get("session_id")
+    if not session_id and payload.get("resume_last"):
+        session_id = registry.resolve(conversation)
+        if not session_id:
+            return {"error": "session_not_found", "message": f"No session to resume for conversation '{conversation}'"}
+    is_resume = bool(session_id)
+
+    sent = registry.sent_state(session_id) if is_resume else None
+    if sent and CODEX_DELTA_PROMPTS:
+        prompt = build_delta_prompt(payload, sent)
+    else:
+        prompt = build_prompt(payload)
+    cmd = get_codex_cmd(session_id=session_id)
+    key = None
+    if CODEX_CACHE and not is_resume and cache_mode != "bypass":
+        key = cache_key(prompt, cmd)
+        if cache_mode == "use" and (cached := get_cache().get(key)):
+            cached.pop("session_id", None)  # 旧版本写入的条目可能带有其他调用方的会话
+            cached["cached"] = True
+            cached["resumable"] = False
+            return cached
+
+    hedge = payload.get("hedge")
+    if hedge is None:
+        hedge = CODEX_HEDGE
+
+    started = time.monotonic()
+    if CODEX_SINGLE_FLIGHT:
+        # 同一 conversation 中相同的命令和提示词正在执行时共享同一个子进程
+        result = await get_flights().do(
+            f"{conversation}:{cache_key(prompt, cmd)}", lambda: _execute(cmd, prompt, session_id, hedge, on_event)
+        )
+    else:
+        result = await _execute(cmd, prompt, session_id, hedge, on_event)
+    if "error" in result:
+        return result
+
+    # 记录会话
+    if new_id := result.get("session_id"):
+        registry.record_turn(conversation, new_id, time.monotonic() - started, prompt_state(payload, sent))
+
+    if key and "schema_errors" not in result and not result.get("coalesced"):
+        get_cache().put(key, {k: v for k, v in result.items() if k != "session_id"})
+    return result
+
+
+async def _execute(
+    cmd: list[str], prompt: str, session_id: str | None, hedge: bool, on_event: EventCallback | None
+) -> dict[str, Any]:
+    """执行一轮 Codex 调用：运行（可对冲）、校验、必要时修复，返回结果或错误。"""
+    is_resume = bool(session_id)
+    schema_path = None if is_resume else write_schema_file()
+    try:
+        if hedge and not is_resume:
+            # 备份请求会开启独立的新会话，不上报流式事件
+            error, stdout, stderr, content = await get_hedger().run(
+                lambda backup: _attempt(cmd, prompt, None if backup else on_event, schema_path),
+                ok=lambda r: r[0] is None and bool(r[3]),
+            )
+        else:
+            error, stdout, stderr, content = await _attempt(cmd, prompt, on_event, schema_path)
+        if error:
+            return error
+
+        if not content:
+            return {"error": "codex_output_empty", "raw_output": stdout}
+
+        new_id = extract_session_id(stdout) or extract_session_id(stderr) or session_id
+
+        # 本地 schema 校验，不符合时在同一会话中请求修复
+        parsed = parse_advisor_output(content)
+        errors = validate_schema(parsed, ADVISOR_SCHEMA) if parsed is not None else ["output is not valid JSON"]
+        _validation_stats["validated"] += 1
+        _validation_stats["invalid" if errors else "valid"] += 1
+        repaired = None
+        if errors and CODEX_REPAIR and new_id:
+            repaired = await _repair(new_id, errors)
+
+        if repaired is not None:
+            result = repaired
+            result["repaired"] = True
+        elif errors:
+            result = parsed if isinstance(parsed, dict) else {"raw_text": content}
+            result["schema_errors"] = errors
+        else:
+            result = parsed
+
+        if new_id:
+            result["session_id"] = new_id
         return result
 
-    except subprocess.TimeoutExpired:
-        return {"error": "timeout", "message": f"Codex execution timed out ({CODEX_TIMEOUT}s)"}
     except FileNotFoundError:
         return {"error": "codex_cli_not_found", "message": "Codex CLI not found"}
     finally:
         if schema_path and os.path.exists(schema_path):
             os.unlink(schema_path)
+
+
+async def _attempt(
+    cmd: list[str], prompt: str, on_event: EventCallback | None, schema_path: str | None
+) -> tuple[dict[str, Any] | None, str, str, str]:
+    """运行一次 Codex 并读取回答，返回 (错误结果, stdout, stderr, 回答内容)。
+
+    新会话（提供 schema_path）使用独立的 -o 输出文件，恢复会话从最终消息或 stdout 读取。
+    """
+    output_path = None
+    if schema_path:
+        fd, output_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        cmd = cmd + ["--output-schema", schema_path, "-o", output_path]
+
+    try:
+        error, stdout, stderr, message = await _run_codex(cmd, prompt, on_event)
+        if error:
+            return error, stdout, stderr, ""
+        content = ""
+        if output_path and os.path.exists(output_path):
+            with open(output_path) as f:
+                content = f.read().strip()
+        elif not schema_path:
+            content = (message or stdout).strip()
+        return None, stdout, stderr, content
+    finally:
         if output_path and os.path.exists(output_path):
             os.unlink(output_path)
+
+
+async def _run_codex(
+    cmd: list[str], prompt: str, on_event: EventCallback | None = None
+) -> tuple[dict[str, Any] | None, str, str, str]:
+    """在本进程并发限制和主机级限流下运行一次 Codex CLI，返回 (错误结果, stdout, stderr, 最终 agent 消息)。"""
+    stream = bool(on_event and CODEX_STREAM)
+    if stream:
+        cmd = cmd + ["--json"]
+
+    async with _get_semaphore(), get_limiter().slot():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, prompt,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LINE_LIMIT,
+            start_new_session=True,  # 独立进程组，终止时不遗留子进程
+        )
+
+        async def consume() -> tuple[str, str, str]:
+            if not stream:
+                out, err = await proc.communicate()
+                return out.decode(errors="replace"), err.decode(errors="replace"), ""
+            (out, message), err = await asyncio.gather(
+                _read_events(proc.stdout, on_event),
+                proc.stderr.read(),
+            )
+            await proc.wait()
+            return out, err.decode(errors="replace"), message
+
+        try:
+            stdout, stderr, message = await asyncio.wait_for(consume(), timeout=CODEX_TIMEOUT)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            return {"error": "timeout", "message": f"Codex execution timed out ({CODEX_TIMEOUT}s)"}, "", "", ""
+        except BaseException:
+            # 被取消或 on_event 回调出错
+            await _kill(proc)
+            raise
+
+    if proc.returncode != 0:
+        return {"error": "codex_cli_failed", "exit_code": proc.returncode, "stderr": stderr[-2000:]}, stdout, stderr, message
+    return None, stdout, stderr, message
+
+
+async def _repair(session_id: str, errors: list[str]) -> dict[str, Any] | None:
+    """在原会话中发送一轮修复请求，返回符合 schema 的结果，失败返回 None。"""
+    _validation_stats["repairs_attempted"] += 1
+    started = time.monotonic()
+    try:
+        error, stdout, _, message = await _run_codex(get_codex_cmd(session_id=session_id), build_repair_prompt(errors))
+    finally:
+        _validation_stats["repair_seconds"] += time.monotonic() - started
+    if error:
+        return None
+    parsed = parse_advisor_output(message or stdout)
+    if parsed is None or validate_schema(parsed, ADVISOR_SCHEMA):
+        return None
+    _validation_stats["repairs_succeeded"] += 1
+    return parsed
+
+
+def split_by_plan(payload: dict[str, Any]) -> list[dict[str, Any]]:
+    """把包含多个候选方案的请求拆成每个方案一次独立评审。"""
+    plans = payload.get("candidate_plans") or []
+    if len(plans) <= 1:
+        return [payload]
+    return [{**payload, "candidate_plans": [plan]} for plan in plans]
+
+
+def _batch_label(payload: dict[str, Any], index: int) -> str:
+    plans = payload.get("candidate_plans") or []
+    if len(plans) == 1:
+        return plans[0].get("name") or f"plan-{index + 1}"
+    return (payload.get("problem") or f"item-{index + 1}")[:80]
+
+
+def merge_syntheses(items: list[dict[str, Any]]) -> dict[str, list[dict[str, str]]]:
+    """按字段汇总各条结果的 synthesis，保留来源标签。"""
+    merged: dict[str, list[dict[str, str]]] = {"key_tensions": [], "critical_unknowns": [], "next_thinking_steps": []}
+    for item in items:
+        synthesis = item["result"].get("synthesis")
+        if not isinstance(synthesis, dict):
+            continue
+        for key, entries in merged.items():
+            if text := synthesis.get(key):
+                entries.append({"item": item["label"], "text": text})
+    return merged
+
+
+async def call_codex_batch_async(
+    payloads: list[dict[str, Any]],
+    max_concurrency: int | None = None,
+    on_item_done: Callable[[int, dict[str, Any]], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """并发执行多条评审，返回逐条结果和合并后的 synthesis。
+
+    并发数受 max_concurrency（默认 CODEX_BATCH_CONCURRENCY）限制，
+    同时仍受全局 CODEX_MAX_CONCURRENCY 约束。
+    """
+    limit = asyncio.Semaphore(max(1, max_concurrency or CODEX_BATCH_CONCURRENCY))
+
+    async def run(index: int, payload: dict[str, Any]) -> dict[str, Any]:
+        async with limit:
+            result = await call_codex_async(payload)
+        if on_item_done:
+            await on_item_done(index, result)
+        return result
+
+    results = await asyncio.gather(*(run(i, p) for i, p in enumerate(payloads)))
+    items = [
+        {"index": i, "label": _batch_label(p, i), "result": r}
+        for i, (p, r) in enumerate(zip(payloads, results))
+    ]
+    failed = [item["index"] for item in items if "error" in item["result"]]
+    return {
+        "items": items,
+        "synthesis": merge_syntheses(items),
+        "succeeded": len(items) - len(failed),
+        "failed": failed,
+    }
+
+
+def call_codex(payload: dict[str, Any]) -> dict[str, Any]:
+    """同步调用（兼容原有接口）。"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop and loop.is_running():
+        # 已在事件循环中，在独立线程里运行
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            future = pool.submit(asyncio.run, call_codex_async(payload))
+            return future.result()
+    else:
+        return asyncio.run(call_codex_async(payload))
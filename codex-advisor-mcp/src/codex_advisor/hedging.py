@@ -0,0 +1,97 @@
+"""Hedged requests - 调用耗时超过近期延迟分位数时发起备份请求，先成功者胜出"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+# 环境变量配置
+CODEX_HEDGE = os.getenv("CODEX_HEDGE", "false").lower() == "true"  # 是否默认对新会话启用对冲
+CODEX_HEDGE_PERCENTILE = float(os.getenv("CODEX_HEDGE_PERCENTILE", "95"))  # 超过该分位数延迟后发起备份请求
+CODEX_HEDGE_MIN_SAMPLES = int(os.getenv("CODEX_HEDGE_MIN_SAMPLES", "10"))  # 样本不足时不对冲
+
+HISTORY_WINDOW = 200  # 保留的最近成功调用延迟数
+
+T = TypeVar("T")
+
+
+class Hedger(Generic[T]):
+    """对冲执行器 - 维护近期延迟历史，主请求超过分位数阈值仍未完成时启动备份请求。"""
+
+    def __init__(
+        self,
+        percentile: float = CODEX_HEDGE_PERCENTILE,
+        min_samples: int = CODEX_HEDGE_MIN_SAMPLES,
+        window: int = HISTORY_WINDOW,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.counters = {"calls": 0, "hedges_fired": 0, "hedge_wins": 0}
+
+    def threshold(self) -> float | None:
+        """当前对冲阈值（秒），样本不足时返回 None。"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return ordered[max(idx, 0)]
+
+    async def run(self, attempt: Callable[[bool], Awaitable[T]], ok: Callable[[T], bool] = lambda _: True) -> T:
+        """运行 attempt(False)，超过阈值后再运行 attempt(True)。
+
+        返回第一个满足 ok 的结果，另一个请求随即取消；都不满足时返回最后完成的结果。
+        """
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(attempt(False))
+        jobs = [primary]
+        try:
+            delay = self.threshold()
+            if delay is not None:
+                done, _ = await asyncio.wait(jobs, timeout=delay)
+                if not done:
+                    jobs.append(asyncio.ensure_future(attempt(True)))
+                    self.counters["hedges_fired"] += 1
+
+            pending = set(jobs)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((j for j in done if not j.exception() and ok(j.result())), None)
+                if winner or not pending:
+                    break
+            if winner is None:
+                return done.pop().result()
+
+            if winner is not primary:
+                self.counters["hedge_wins"] += 1
+            self.latencies.append(time.monotonic() - started)
+            return winner.result()
+        finally:
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        calls, fired = self.counters["calls"], self.counters["hedges_fired"]
+        threshold = self.threshold()
+        return {
+            **self.counters,
+            "fire_rate": round(fired / calls, 3) if calls else None,
+            "win_rate": round(self.counters["hedge_wins"] / fired, 3) if fired else None,
+            "threshold_seconds": round(threshold, 3) if threshold is not None else None,
+            "samples": len(self.latencies),
+            "percentile": self.percentile,
+        }
+
+
+_hedger: Hedger | None = None
+
+
+def get_hedger() -> Hedger:
+    """获取进程级对冲执行器。"""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
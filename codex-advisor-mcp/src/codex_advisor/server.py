@@ -1,12 +1,17 @@
 """Codex Advisor MCP Server - Socratic technical review powered by Codex CLI"""
-from mcp.server.fastmcp import FastMCP
-from .codex_client import call_codex
+from mcp.server.fastmcp import Context, FastMCP
+from .cache import get_cache
+from .codex_client import call_codex_async, call_codex_batch_async, split_by_plan, validation_stats
+from .hedging import get_hedger
+from .ratelimit import get_limiter
+from .sessions import DEFAULT_CONVERSATION, get_registry
+from .singleflight import get_flights
 
 mcp = FastMCP("codex-advisor")
 
 
 @mcp.tool()
-def ask_codex_advisor(
+async def ask_codex_advisor(
     problem: str,
     context: str = "",
     candidate_plans: list[dict] | None = None,
@@ -16,6 +21,10 @@ def ask_codex_advisor(
     phase: str = "initial",
     session_id: str | None = None,
     resume_last: bool = False,
+    conversation_id: str | None = None,
+    cache: str = "use",
+    hedge: bool | None = None,
+    ctx: Context = None,
 ) -> dict:
     """
     向 Codex Advisor 咨询技术问题并获得建议。支持多轮会话。
@@ -30,7 +39,9 @@ def ask_codex_advisor(
     **会话管理**:
     - 首次调用会创建新会话,返回 session_id
     - 后续调用传入 session_id 可恢复会话上下文
-    - 或设置 resume_last=True 自动恢复最近会话
+    - 或设置 resume_last=True 恢复当前 conversation 最近的会话
+    - 会话按 conversation_id 隔离(未提供时使用 MCP 客户端 ID),并发调用方互不干扰
+    - 两者都没有时使用仅在本进程内有效的默认会话方,不会落盘,也不会被其他客户端恢复
 
     Args:
         problem: 需要分析的技术问题或设计决策(必填)
@@ -41,7 +52,10 @@ def ask_codex_advisor(
         non_goals: 明确排除的目标或方向
         phase: 对话阶段("initial", "refinement", "final")
         session_id: 会话 ID,用于恢复之前的对话上下文
-        resume_last: 是否恢复最近的会话(当 session_id 未提供时生效)
+        resume_last: 是否恢复当前 conversation 最近的会话(当 session_id 未提供时生效)
+        conversation_id: 会话方标识,用于隔离不同调用方/对话的会话记录
+        cache: 结果缓存策略("use" 命中即返回, "bypass" 不读不写, "refresh" 强制重新评审并更新缓存)
+        hedge: 是否对冲慢请求(默认 CODEX_HEDGE),超过近期延迟分位数时再发起一次相同请求,先完成者胜出
 
     Returns:
         苏格拉底式评审结果,包含以下字段:
@@ -53,8 +67,22 @@ def ask_codex_advisor(
         - guided_insights: 引导性洞察(observation, implication)- 非直接推荐
         - synthesis: 综合总结(key_tensions, critical_unknowns, next_thinking_steps)
         - session_id: 会话 ID(用于后续调用恢复上下文)
+        - cached: 结果来自缓存时为 True(此时不含 session_id,resumable 为 False,需要追问时用 cache="refresh" 开启新会话)
+
+    **流式进度**: 运行期间每个 Codex 事件发送一次 MCP 进度通知,
+    socratic_questions 中每完成一个问题即以日志通知提前推送。
     """
-    return call_codex({
+    async def on_event(update: dict):
+        if not ctx:
+            return
+        try:
+            for question in update["new_questions"]:
+                await ctx.info(f"socratic_question: {question}")
+            await ctx.report_progress(update["questions_so_far"])
+        except Exception:
+            pass  # 客户端未请求进度或已断开
+
+    return await call_codex_async({
         "problem": problem,
         "context": context,
         "candidate_plans": candidate_plans,
@@ -64,7 +92,123 @@ def ask_codex_advisor(
         "phase": phase,
         "session_id": session_id,
         "resume_last": resume_last,
-    })
+        "conversation_id": conversation_id or (ctx and ctx.client_id) or DEFAULT_CONVERSATION,
+        "cache": cache,
+        "hedge": hedge,
+    }, on_event)
+
+
+@mcp.tool()
+async def ask_codex_advisor_batch(
+    items: list[dict],
+    split_plans: bool = False,
+    max_concurrency: int | None = None,
+    conversation_id: str | None = None,
+    ctx: Context = None,
+) -> dict:
+    """
+    并行评审多个问题或多个候选方案。
+
+    每个 item 的字段与 ask_codex_advisor 的参数相同(problem 必填)。
+    设置 split_plans=True 时,含多个 candidate_plans 的 item 会拆成每个方案一次独立评审。
+    所有评审并发执行,每完成一条发送一次 MCP 进度通知。
+
+    Args:
+        items: 评审请求列表
+        split_plans: 是否按候选方案拆分评审
+        max_concurrency: 本次批量的并发上限(默认 CODEX_BATCH_CONCURRENCY)
+        conversation_id: 未在 item 中指定时使用的会话方标识
+
+    Returns:
+        - items: 逐条结果列表(index, label, result),result 与 ask_codex_advisor 返回一致
+        - synthesis: 合并后的综合总结,key_tensions/critical_unknowns/next_thinking_steps
+          各为 [{item, text}] 列表
+        - succeeded: 成功条数
+        - failed: 失败条目的 index 列表
+    """
+    default_conversation = conversation_id or (ctx and ctx.client_id) or DEFAULT_CONVERSATION
+    payloads = []
+    for item in items:
+        payload = {"conversation_id": default_conversation, **item}
+        payloads.extend(split_by_plan(payload) if split_plans else [payload])
+
+    done = 0
+
+    async def on_item_done(index: int, result: dict):
+        nonlocal done
+        done += 1
+        if ctx:
+            try:
+                await ctx.report_progress(done, len(payloads))
+            except Exception:
+                pass  # 客户端未请求进度或已断开
+
+    return await call_codex_batch_async(payloads, max_concurrency, on_item_done)
+
+
+@mcp.tool()
+def list_codex_sessions(conversation_id: str | None = None) -> list[dict]:
+    """
+    列出已记录的 Codex 会话(最近使用的在前)。
+
+    Args:
+        conversation_id: 只列出该会话方的会话(可选)
+
+    Returns:
+        会话列表,每项包含 session_id, conversation, created, last_used, turns, total_latency
+    """
+    return get_registry().list(conversation_id)
+
+
+@mcp.tool()
+def get_codex_cache_stats() -> dict:
+    """
+    查看 Codex Advisor 结果缓存的统计信息。
+
+    Returns:
+        hits, misses, stores, expired, evictions, hit_rate(本进程计数),
+        entries(当前缓存条数), max_entries, ttl_seconds, path,
+        single_flight(executions, coalesced, in_flight: 进行中调用的合并情况)
+    """
+    return {**get_cache().stats(), "single_flight": get_flights().stats()}
+
+
+@mcp.tool()
+def get_codex_validation_stats() -> dict:
+    """
+    查看 Codex 输出校验与修复的统计信息（本进程计数）。
+
+    Returns:
+        validated, valid, invalid, repairs_attempted, repairs_succeeded,
+        repair_seconds(修复轮累计耗时)
+    """
+    return validation_stats()
+
+
+@mcp.tool()
+def get_codex_hedge_stats() -> dict:
+    """
+    查看对冲请求的统计信息（本进程计数）。
+
+    Returns:
+        calls, hedges_fired, hedge_wins, fire_rate, win_rate,
+        threshold_seconds(当前对冲阈值), samples(延迟样本数), percentile
+    """
+    return get_hedger().stats()
+
+
+@mcp.tool()
+def get_codex_rate_limit_stats() -> dict:
+    """
+    查看主机级限流器的状态和排队等待时间。
+
+    Returns:
+        key(模型), enabled, rpm, burst, max_sessions,
+        waiting(本进程正在排队的调用数), acquired, queued(需要排队的调用数),
+        wait_seconds, max_wait_seconds, avg_wait_seconds,
+        host_sessions(主机上该模型运行中的会话数), host_tokens(令牌桶剩余)
+    """
+    return get_limiter().stats()
 
 
 def main():
@@ -0,0 +1,159 @@
+"""Session registry - 按会话方（conversation）隔离的 Codex 会话记录，持久化到磁盘"""
+import fcntl
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+# 环境变量配置
+CODEX_SESSIONS_PATH = os.getenv(
+    "CODEX_SESSIONS_PATH", str(Path.home() / ".cache" / "codex-advisor" / "sessions.json")
+)
+CODEX_SESSION_TTL = int(os.getenv("CODEX_SESSION_TTL", "86400"))  # 空闲多久后淘汰（秒），默认 1 天
+CODEX_MAX_SESSIONS = int(os.getenv("CODEX_MAX_SESSIONS", "200"))  # 超出后淘汰最久未使用的会话
+
+DEFAULT_CONVERSATION = "default"  # 未提供 conversation_id 和客户端 ID 时的隐式会话方，只在本进程内有效
+
+
+@dataclass
+class SessionInfo:
+    session_id: str
+    conversation: str
+    created: float
+    last_used: float
+    turns: int = 0
+    total_latency: float = 0.0  # 累计耗时（秒）
+    sent: dict[str, Any] = field(default_factory=dict)  # 会话已看到的提示词内容摘要
+
+
+class SessionRegistry:
+    """会话注册表 - 每个 conversation 记录其最近的 Codex 会话，空闲超时或超量时按 LRU 淘汰。
+
+    多个服务进程共用同一个文件：写入时持有文件锁，先重新读取其他进程的记录再合并写回；
+    文件被其他进程更新后，读取前会重新加载。隐式的默认会话方不落盘，不会跨进程（跨客户端）恢复。
+    """
+
+    def __init__(self, path: str = CODEX_SESSIONS_PATH, ttl: int = CODEX_SESSION_TTL, max_sessions: int = CODEX_MAX_SESSIONS):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions: dict[str, SessionInfo] = {}  # session_id -> 会话信息
+        self.latest: dict[str, str] = {}  # conversation -> 最近的 session_id
+        self._mtime: int | None = None  # 最近一次读取或写入时文件的修改时间
+        self._load()
+
+    @contextmanager
+    def _locked(self):
+        """持有注册表的文件锁，多个进程的读-改-写互斥。"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _load(self):
+        """从磁盘读取全部会话记录，本进程的默认会话方记录保持不变。"""
+        sessions = {sid: s for sid, s in self.sessions.items() if s.conversation == DEFAULT_CONVERSATION}
+        latest = {conv: sid for conv, sid in self.latest.items() if conv == DEFAULT_CONVERSATION}
+        try:
+            with open(self.path) as f:
+                self._mtime = os.fstat(f.fileno()).st_mtime_ns
+                data = json.load(f)
+            for item in data.get("sessions", []):
+                info = SessionInfo(**item)
+                if info.conversation != DEFAULT_CONVERSATION:
+                    sessions[info.session_id] = info
+            latest.update((conv, sid) for conv, sid in dict(data.get("latest", {})).items() if conv != DEFAULT_CONVERSATION)
+        except (OSError, ValueError, TypeError):
+            pass
+        self.sessions, self.latest = sessions, latest
+        self._evict()
+
+    def _refresh(self):
+        """文件被其他进程更新过时重新读取。"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def _save(self):
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "sessions": [asdict(s) for s in self.sessions.values() if s.conversation != DEFAULT_CONVERSATION],
+            "latest": {conv: sid for conv, sid in self.latest.items() if conv != DEFAULT_CONVERSATION},
+        }
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._mtime = os.stat(path).st_mtime_ns
+
+    def _evict(self):
+        now = time.time()
+        for sid in [sid for sid, s in self.sessions.items() if now - s.last_used > self.ttl]:
+            del self.sessions[sid]
+        if len(self.sessions) > self.max_sessions:
+            by_age = sorted(self.sessions.values(), key=lambda s: s.last_used)
+            for info in by_age[:len(self.sessions) - self.max_sessions]:
+                del self.sessions[info.session_id]
+        self.latest = {conv: sid for conv, sid in self.latest.items() if sid in self.sessions}
+
+    def resolve(self, conversation: str) -> str | None:
+        """返回该 conversation 最近的会话 ID。"""
+        self._refresh()
+        sid = self.latest.get(conversation)
+        if sid and (info := self.sessions.get(sid)) and time.time() - info.last_used <= self.ttl:
+            return sid
+        return None
+
+    def sent_state(self, session_id: str) -> dict[str, Any] | None:
+        """返回该会话已发送内容的摘要，未记录时返回 None。"""
+        self._refresh()
+        if info := self.sessions.get(session_id):
+            return info.sent or None
+        return None
+
+    def record_turn(self, conversation: str, session_id: str, latency: float, sent: dict[str, Any] | None = None):
+        """记录一轮对话：持有文件锁，合并其他进程的最新记录后写回。"""
+        with self._locked():
+            self._load()
+            now = time.time()
+            info = self.sessions.get(session_id)
+            if info is None:
+                info = self.sessions[session_id] = SessionInfo(session_id, conversation, created=now, last_used=now)
+            info.last_used = now
+            info.turns += 1
+            info.total_latency += latency
+            if sent is not None:
+                info.sent = sent
+            self.latest[conversation] = session_id
+            self._evict()
+            self._save()
+
+    def list(self, conversation: str | None = None) -> list[dict[str, Any]]:
+        self._refresh()
+        items = [s for s in self.sessions.values() if conversation is None or s.conversation == conversation]
+        return [
+            {k: v for k, v in asdict(s).items() if k != "sent"}
+            for s in sorted(items, key=lambda s: s.last_used, reverse=True)
+        ]
+
+
+_registry: SessionRegistry | None = None
+
+
+def get_registry() -> SessionRegistry:
+    """获取进程级会话注册表。"""
+    global _registry
+    if _registry is None:
+        _registry = SessionRegistry()
+    return _registry
@@ -0,0 +1,97 @@
+"""Adaptive Concurrency - 按系统负载和任务结果用 AIMD 调整执行池并发数"""
+import os
+import time
+from collections import deque
+
+# 配置（支持环境变量）
+MIN_WORKERS = int(os.getenv("DROID_MIN_WORKERS", "1"))
+ADAPTIVE_MAX_WORKERS = int(os.getenv("DROID_ADAPTIVE_MAX_WORKERS", str(os.cpu_count() or 8)))
+
+MAX_LOAD_PER_CPU = 1.0  # 1 分钟 loadavg / CPU 数超过该值视为过载
+MIN_MEM_AVAILABLE = 0.10  # 可用内存占比低于该值视为过载
+MAX_FAILURE_RATE = 0.5  # 最近任务失败/超时比例超过该值视为过载
+ADJUST_INTERVAL = 5.0  # 两次调整的最小间隔（秒）
+OUTCOME_WINDOW = 20  # 统计失败率的最近任务数
+
+
+def read_load_per_cpu() -> float | None:
+    """读取 /proc/loadavg 的 1 分钟负载并按 CPU 数归一化"""
+    try:
+        with open("/proc/loadavg") as f:
+            load1 = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return load1 / (os.cpu_count() or 1)
+
+
+def read_mem_available() -> float | None:
+    """读取 /proc/meminfo 中可用内存占总内存的比例"""
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("MemTotal", "MemAvailable"):
+                    info[key] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    if not info.get("MemTotal") or "MemAvailable" not in info:
+        return None
+    return info["MemAvailable"] / info["MemTotal"]
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发控制器 - 未过载且槽位用满时加 1，过载时减半"""
+
+    def __init__(self, initial: int, min_limit: int = MIN_WORKERS, max_limit: int = ADAPTIVE_MAX_WORKERS):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.outcomes: deque[bool] = deque(maxlen=OUTCOME_WINDOW)  # True = 失败或超时
+        self.last_adjust = 0.0
+        self.last_reason = ""
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def record(self, status: str | None):
+        """记录任务结果（success / failed / timeout / error）"""
+        if status:
+            self.outcomes.append(status != "success")
+
+    def overload_reason(self) -> str | None:
+        load = read_load_per_cpu()
+        if load is not None and load > MAX_LOAD_PER_CPU:
+            return f"load {load:.2f}/cpu"
+        mem = read_mem_available()
+        if mem is not None and mem < MIN_MEM_AVAILABLE:
+            return f"mem available {mem:.0%}"
+        if len(self.outcomes) >= OUTCOME_WINDOW // 2:
+            rate = sum(self.outcomes) / len(self.outcomes)
+            if rate > MAX_FAILURE_RATE:
+                return f"failure rate {rate:.0%}"
+        return None
+
+    def adjust(self, running: int):
+        """按当前负载调整并发上限，间隔内最多调整一次"""
+        now = time.monotonic()
+        if now - self.last_adjust < ADJUST_INTERVAL:
+            return
+        self.last_adjust = now
+
+        if reason := self.overload_reason():
+            self.limit = max(self.min_limit, self.limit / 2)
+            self.last_reason = reason
+            self.outcomes.clear()
+        elif running >= self.current:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.last_reason = "saturated"
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.current,
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "last_reason": self.last_reason,
+        }
@@ -0,0 +1,78 @@
+"""Task batching - 把多个小的独立就绪任务合并为一次 droid 调用，再按任务拆分结果"""
+import json
+import os
+from typing import Any
+
+from .process import normalize_output
+
+# 环境变量配置
+DROID_BATCH = os.getenv("DROID_BATCH", "false").lower() == "true"  # execute_dag 默认是否合并小任务
+DROID_BATCH_MAX_TASKS = int(os.getenv("DROID_BATCH_MAX_TASKS", "5"))  # 每批最多任务数
+DROID_BATCH_MAX_COST = float(os.getenv("DROID_BATCH_MAX_COST", "0"))  # 每批任务权重之和上限（同 estimated_cost 单位），0 表示不限
+
+RESULT_FORMAT = (
+    "These tasks are independent; complete each one fully. When finished, reply with a single JSON object "
+    'of the form {"tasks": [{"id": "<task id>", "status": "success" | "failed", "summary": "...", '
+    '"files_changed": ["path", ...], "commands_run": ["command", ...]}]} containing exactly one entry per task above.'
+)
+
+
+def batch_payload(payloads: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """合并多个任务的参数：逐个列出任务，files_of_interest 取并集，执行选项取自首个任务（同批任务一致）。"""
+    first = next(iter(payloads.values()))
+    sections = []
+    files: dict[str, None] = {}
+    for tid, payload in payloads.items():
+        lines = [f"## Task {tid}", f"Objective: {payload.get('objective') or ''}"]
+        if payload.get("instructions"):
+            lines.append(f"Instructions: {payload['instructions']}")
+        if payload.get("constraints"):
+            lines.append("Constraints: " + "; ".join(payload["constraints"]))
+        if payload.get("acceptance_criteria"):
+            lines.append("Acceptance criteria: " + "; ".join(payload["acceptance_criteria"]))
+        sections.append("\n".join(lines))
+        files.update(dict.fromkeys((payload.get("context") or {}).get("files_of_interest") or []))
+
+    context = dict(first.get("context") or {})
+    if files:
+        context["files_of_interest"] = list(files)
+    combined = {
+        "objective": f"Complete the following {len(payloads)} independent tasks: " + ", ".join(payloads),
+        "instructions": "\n\n".join([*sections, RESULT_FORMAT]),
+        "context": context,
+        "constraints": [],
+        "acceptance_criteria": [],
+    }
+    for key in ("executor", "timeout", "read_only", "hedge", "coalesce"):
+        if key in first:
+            combined[key] = first[key]
+    return combined
+
+
+def _find_tasks(text: str) -> list | None:
+    """在输出文本中找出含 tasks 数组的 JSON 对象（可能夹在说明文字或代码块中）。"""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            value = None
+        if isinstance(value, dict) and isinstance(value.get("tasks"), list):
+            return value["tasks"]
+        start = text.find("{", start + 1)
+    return None
+
+
+def split_batch_result(outcome: dict[str, Any], task_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """从合并执行的结果中拆出各任务的结果（与单任务结果格式相同），缺少结果的任务不出现在返回值中。"""
+    entries = outcome.get("tasks")
+    if not isinstance(entries, list):
+        entries = _find_tasks(outcome.get("summary") or "") or []
+    results: dict[str, dict[str, Any]] = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("id") not in task_ids or entry["id"] in results:
+            continue
+        fields = {k: v for k, v in entry.items() if k != "id"}
+        results[entry["id"]] = normalize_output(fields, "")
+    return results
@@ -1,11 +1,23 @@
 """Droid CLI client - async subprocess 直连调用 Droid CLI"""
 import asyncio
+import hashlib
 import json
 import os
-from typing import Any
+from typing import Any, Awaitable, Callable
 
+from .hedging import DROID_HEDGE, get_hedger
+from .process import OutputTail, drain, error_result, iter_lines, normalize_output, parse_json, terminate
+from .ratelimit import get_limiter
+from .singleflight import get_flights
 
-def get_droid_cmd() -> list[str]:
+DROID_SINGLE_FLIGHT = os.getenv("DROID_SINGLE_FLIGHT", "true").lower() == "true"  # 合并进行中的相同任务
+
+READ_ONLY_TOOLS = "LS,Read,Glob,Grep"  # 只读任务可用的工具集
+
+EventCallback = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+def get_droid_cmd(read_only: bool = False) -> list[str]:
     """构建 Droid CLI 命令。
 
     支持的环境变量（在 .mcp.json 中配置）：
@@ -13,19 +25,22 @@ def get_droid_cmd() -> list[str]:
     - DROID_ENABLED_TOOLS: 启用的工具集（默认 LS,Read,Glob,Grep,Edit,Create,Execute）
     - DROID_AUTO_LEVEL: 自动化级别（默认 high）
     - DROID_REASONING_EFFORT: 推理深度（默认使用 CLI 默认值）
+    - DROID_OUTPUT_FORMAT: 输出格式（默认 json；stream-json 可逐事件上报进度）
+
+    read_only=True 时只启用只读工具且不开启自动执行，忽略 DROID_ENABLED_TOOLS 和 DROID_AUTO_LEVEL。
     """
     if env_cmd := os.getenv("DROID_CLI_CMD"):
         return env_cmd.split()
 
     enabled_tools = os.getenv("DROID_ENABLED_TOOLS", "LS,Read,Glob,Grep,Edit,Create,Execute")
     auto_level = os.getenv("DROID_AUTO_LEVEL", "high")
+    output_format = os.getenv("DROID_OUTPUT_FORMAT", "json")
 
-    cmd = [
-        "droid", "exec",
-        "--output-format", "json",
-        "--auto", auto_level,
-        "--enabled-tools", enabled_tools,
-    ]
+    cmd = ["droid", "exec", "--output-format", output_format]
+    if read_only:
+        cmd.extend(["--enabled-tools", READ_ONLY_TOOLS])
+    else:
+        cmd.extend(["--auto", auto_level, "--enabled-tools", enabled_tools])
 
     # 可选参数：仅在设置时添加
     if model := os.getenv("DROID_MODEL"):
@@ -69,119 +84,60 @@ def build_prompt(payload: dict[str, Any]) -> str:
     return "\n".join(parts)
 
 
-def _clip(text: str | None, limit: int = 800) -> str:
-    if not text:
-        return ""
-    text = text.strip()
-    return text[-limit:] if len(text) > limit else text
-
-
-def _parse_json(raw: str) -> dict | None:
-    """解析 Droid CLI JSON 输出。"""
-    if not raw.strip():
-        return None
-    try:
-        return json.loads(raw.strip())
-    except json.JSONDecodeError:
-        pass
-
-    for line in reversed(raw.strip().splitlines()):
+async def _read_events(stream: asyncio.StreamReader, tail: OutputTail, on_event: EventCallback | None) -> dict | None:
+    """增量解析 JSON/NDJSON 输出，返回 result 事件（没有则返回最后一个 JSON 对象）"""
+    result = last = None
+    async for raw in iter_lines(stream):
+        line = raw.decode(errors="replace")
+        tail.append(line + "\n")
         line = line.strip()
-        if line.startswith('{') and line.endswith('}'):
-            try:
-                return json.loads(line)
-            except json.JSONDecodeError:
-                continue
-    return None
-
-
-def _normalize_output(data: dict | None, stdout: str) -> dict[str, Any]:
-    """标准化输出格式。"""
-    base = {
-        "status": "success",
-        "summary": "",
-        "files_changed": [],
-        "commands_run": [],
-        "tests": {},
-        "logs": [],
-        "issues": [],
-    }
-
-    if not data:
-        base["summary"] = _clip(stdout) or "Execution completed"
-        if stdout.strip():
-            base["logs"] = [_clip(stdout)]
-        return base
-
-    # 支持官方 droid exec JSON 格式
-    if data.get("type") == "result":
-        base["status"] = "failed" if data.get("is_error") or data.get("subtype") == "error" else "success"
-        base["summary"] = data.get("result") or ""
-        if data.get("session_id"):
-            base["logs"].append(f"session_id: {data['session_id']}")
-        if data.get("duration_ms"):
-            base["logs"].append(f"duration: {data['duration_ms']}ms")
-    else:
-        base["status"] = data.get("status") or "success"
-        base["summary"] = data.get("summary") or data.get("message") or data.get("result") or ""
-
-    # 映射文件变更
-    for key in ["files_changed", "files", "changes"]:
-        if files := data.get(key):
-            base["files_changed"] = [
-                {"path": f if isinstance(f, str) else f.get("path", ""), "change_type": "modified", "highlights": []}
-                for f in files
-            ]
-            break
-
-    # 映射命令
-    for key in ["commands_run", "commands"]:
-        if cmds := data.get(key):
-            base["commands_run"] = [
-                {"command": c if isinstance(c, str) else c.get("command", ""), "exit_code": None if isinstance(c, str) else c.get("exit_code"), "stdout_excerpt": "", "stderr_excerpt": ""}
-                for c in cmds
-            ]
-            break
-
-    if not base["summary"]:
-        base["summary"] = _clip(stdout) or "Execution completed"
-
-    return base
-
-
-def _error_result(status: str, summary: str, stdout: str = "", stderr: str = "") -> dict[str, Any]:
-    """构建错误结果。"""
-    return {
-        "status": status,
-        "summary": summary,
-        "files_changed": [],
-        "commands_run": [],
-        "tests": {},
-        "logs": [item for item in [_clip(stdout), _clip(stderr)] if item],
-        "issues": [{"type": "error", "description": summary, "suggested_action": "Check Droid CLI logs"}],
-    }
-
-
-async def call_droid_async(payload: dict[str, Any]) -> dict[str, Any]:
+        if not (line.startswith('{') and line.endswith('}')):
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(event, dict):
+            continue
+        if event.get("type") == "result":
+            result = event
+        else:
+            last = event
+        if on_event:
+            await on_event(event)
+    return result or last
+
+
+async def call_droid_async(payload: dict[str, Any], on_event: EventCallback | None = None) -> dict[str, Any]:
     """异步调用 Droid CLI 并返回结果。
 
     支持的环境变量：
-    - DROID_TIMEOUT: 单任务超时秒数（默认 1800，即 30 分钟）
+    - DROID_TIMEOUT: 单任务超时秒数（默认 1800，即 30 分钟），payload["timeout"] 可覆盖
+
+    输出逐行流式解析，只保留有界尾部；每解析出一个 JSON 事件都会调用 on_event。
+    超时或被取消时终止整个 droid 进程组，避免遗留子进程。
+
+    payload["read_only"] 为真时以只读工具集运行；此时若 payload["hedge"]（默认 DROID_HEDGE）开启，
+    执行时间超过近期延迟分位数会再启动一个相同的执行，先成功者胜出，另一个进程组被终止。
+
+    payload["coalesce"]（默认 DROID_SINGLE_FLIGHT）开启时，命令完全相同的并发调用共享同一次执行，
+    后到的调用拿到结果副本（带 coalesced: true）；有副作用且需要各自执行的任务应传 False。
     """
-    timeout = int(os.getenv("DROID_TIMEOUT", "1800"))
+    timeout = payload.get("timeout") or int(os.getenv("DROID_TIMEOUT", "1800"))
 
     objective = (payload.get("objective") or "").strip()
     if not objective:
-        return _error_result("error", "Objective 不能为空")
+        return error_result("error", "Objective 不能为空")
     if len(objective) > 50000:
-        return _error_result("error", f"Objective 过长 ({len(objective)} 字符)")
+        return error_result("error", f"Objective 过长 ({len(objective)} 字符)")
 
     instructions = payload.get("instructions") or ""
     if len(instructions) > 100000:
-        return _error_result("error", f"Instructions 过长 ({len(instructions)} 字符)")
+        return error_result("error", f"Instructions 过长 ({len(instructions)} 字符)")
 
     prompt = build_prompt(payload)
-    cmd = get_droid_cmd()
+    read_only = bool(payload.get("read_only"))
+    cmd = get_droid_cmd(read_only=read_only)
 
     ctx = payload.get("context") or {}
     if isinstance(ctx, str):
@@ -192,33 +148,77 @@ async def call_droid_async(payload: dict[str, Any]) -> dict[str, Any]:
 
     cmd.append(prompt)
 
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
+    hedge = payload.get("hedge")
+    if hedge is None:
+        hedge = DROID_HEDGE
 
-        try:
-            stdout_bytes, stderr_bytes = await asyncio.wait_for(
-                proc.communicate(),
-                timeout=timeout
+    async def execute() -> dict[str, Any]:
+        if read_only and hedge:
+            # 备份执行不上报事件，避免进度重复
+            return await get_hedger().run(
+                lambda backup: _run_droid(cmd, timeout, None if backup else on_event),
+                ok=lambda r: r.get("status") == "success",
             )
-        except asyncio.TimeoutError:
-            proc.kill()
-            await proc.wait()
-            return _error_result("timeout", f"Droid 执行超时（{timeout}秒）")
+        return await _run_droid(cmd, timeout, on_event)
+
+    coalesce = payload.get("coalesce")
+    if coalesce is None:
+        coalesce = DROID_SINGLE_FLIGHT
+    if coalesce:
+        # 同一仓库中完全相同的任务正在执行时共享同一个 droid 进程
+        return await get_flights().do(_flight_key(cmd), execute)
+    return await execute()
 
-        stdout = stdout_bytes.decode() if stdout_bytes else ""
-        stderr = stderr_bytes.decode() if stderr_bytes else ""
 
-        if proc.returncode != 0:
-            return _error_result("failed", f"Droid CLI failed with code {proc.returncode}", stdout, stderr)
+def _flight_key(cmd: list[str]) -> str:
+    """按完整命令（含 --cwd 和规范化空白后的提示词）计算合并键。"""
+    normalized = [" ".join(part.split()) for part in cmd]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
 
-        return _normalize_output(_parse_json(stdout), stdout)
 
-    except FileNotFoundError:
-        return _error_result("error", "Droid CLI not found")
+async def _run_droid(cmd: list[str], timeout: float, on_event: EventCallback | None) -> dict[str, Any]:
+    """在主机级限流下运行一次 droid 进程并解析输出（排队时间不计入超时）。"""
+    async with get_limiter().slot():
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,  # 独立进程组，便于整体终止
+            )
+
+            out_tail, err_tail = OutputTail(), OutputTail()
+
+            async def consume() -> dict | None:
+                data, _ = await asyncio.gather(
+                    _read_events(proc.stdout, out_tail, on_event),
+                    drain(proc.stderr, err_tail),
+                )
+                await proc.wait()
+                return data
+
+            try:
+                data = await asyncio.wait_for(consume(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await terminate(proc)
+                return error_result("timeout", f"Droid 执行超时（{timeout}秒）", out_tail.text(), err_tail.text())
+            except BaseException:
+                # 被取消或 on_event 回调出错
+                await terminate(proc)
+                raise
+
+            stdout = out_tail.text()
+            stderr = err_tail.text()
+
+            if proc.returncode != 0:
+                return error_result("failed", f"Droid CLI failed with code {proc.returncode}", stdout, stderr)
+
+            # 非逐行 JSON（如多行格式化输出）时回退到整体解析
+            return normalize_output(data or parse_json(stdout), stdout)
+
+        except FileNotFoundError:
+            return error_result("error", "Droid CLI not found")
 
 
 def call_droid(payload: dict[str, Any]) -> dict[str, Any]:
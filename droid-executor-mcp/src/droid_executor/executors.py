@@ -0,0 +1,171 @@
+"""Executor backends - DAG 任务可选的执行后端：droid、codex 或直接运行命令的 shell
+
+所有后端都返回与 droid 相同的规范化结果（status, summary, files_changed, commands_run, tests, logs, issues）。
+"""
+import asyncio
+import os
+import shlex
+import tempfile
+from typing import Any
+
+from .droid_client import EventCallback, build_prompt, call_droid_async
+from .process import OutputTail, clip, drain, error_result, normalize_output, parse_json, terminate
+from .ratelimit import MCP_RATE_LIMIT_PATH, RateLimiter
+
+# 环境变量配置
+DROID_SHELL_TIMEOUT = int(os.getenv("DROID_SHELL_TIMEOUT", "600"))  # shell 任务默认超时（秒）
+DROID_CODEX_CMD = os.getenv("DROID_CODEX_CMD")  # 覆盖 codex 任务的基础命令（默认 codex exec）
+DROID_CODEX_MODEL = os.getenv("DROID_CODEX_MODEL") or os.getenv("CODEX_MODEL")  # codex 任务使用的模型
+DROID_CODEX_TIMEOUT = int(os.getenv("DROID_CODEX_TIMEOUT", os.getenv("DROID_TIMEOUT", "1800")))  # codex 任务默认超时（秒）
+
+EXECUTORS = ("droid", "codex", "shell")
+
+
+def check_executor(task_id: str, executor: Any, command: Any):
+    """校验任务的执行后端和命令，无效时抛出 ValueError。"""
+    if executor not in EXECUTORS:
+        raise ValueError(f"Task '{task_id}': unknown executor '{executor}' (expected one of {', '.join(EXECUTORS)})")
+    if executor == "shell":
+        if isinstance(command, str):
+            valid = bool(command.strip())
+        else:
+            valid = isinstance(command, list) and bool(command) and all(isinstance(part, str) for part in command)
+        if not valid:
+            raise ValueError(f"Task '{task_id}': shell executor needs a 'command' string or argument list")
+    elif command is not None:
+        raise ValueError(f"Task '{task_id}': 'command' only applies to the shell executor")
+
+
+async def run_task(payload: dict[str, Any], on_event: EventCallback | None = None) -> dict[str, Any]:
+    """按 payload["executor"]（默认 droid）把任务分发到对应后端。"""
+    executor = payload.get("executor") or "droid"
+    if executor == "shell":
+        return await call_shell_async(payload)
+    if executor == "codex":
+        return await call_codex_async(payload, on_event)
+    return await call_droid_async(payload, on_event)
+
+
+async def _run_process(cmd: str | list[str], cwd: str | None, timeout: float) -> tuple[int | None, str, str]:
+    """运行子进程（字符串命令经 /bin/sh 执行），返回 (退出码, stdout 尾部, stderr 尾部)，超时时退出码为 None。"""
+    options = dict(
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,  # 独立进程组，便于整体终止
+    )
+    if isinstance(cmd, str):
+        proc = await asyncio.create_subprocess_shell(cmd, **options)
+    else:
+        proc = await asyncio.create_subprocess_exec(*cmd, **options)
+
+    out_tail, err_tail = OutputTail(), OutputTail()
+
+    async def consume():
+        await asyncio.gather(drain(proc.stdout, out_tail), drain(proc.stderr, err_tail))
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(consume(), timeout=timeout)
+    except asyncio.TimeoutError:
+        await terminate(proc)
+        return None, out_tail.text(), err_tail.text()
+    except BaseException:
+        await terminate(proc)
+        raise
+    return proc.returncode, out_tail.text(), err_tail.text()
+
+
+def _repo_root(payload: dict[str, Any]) -> str | None:
+    ctx = payload.get("context") or {}
+    return ctx.get("repo_root") if isinstance(ctx, dict) else None
+
+
+async def call_shell_async(payload: dict[str, Any]) -> dict[str, Any]:
+    """在 repo_root 中直接运行 payload["command"]，不经过模型。
+
+    退出码为 0 时成功；超时或被取消时终止整个进程组。
+    """
+    command = payload.get("command")
+    timeout = payload.get("timeout") or DROID_SHELL_TIMEOUT
+    display = command if isinstance(command, str) else shlex.join(command or [])
+    try:
+        code, stdout, stderr = await _run_process(command, _repo_root(payload), timeout)
+    except (FileNotFoundError, NotADirectoryError, PermissionError) as exc:
+        return error_result("error", f"Command could not be started: {exc}")
+
+    if code is None:
+        status, summary = "timeout", f"Command timed out after {timeout}s: {display}"
+    else:
+        status = "success" if code == 0 else "failed"
+        last = next((line for line in reversed((stderr if code else stdout).strip().splitlines()) if line.strip()), "")
+        summary = f"Command exited with code {code}: {display}" + (f"\n{clip(last, 300)}" if last else "")
+    result = normalize_output({"status": status, "summary": summary}, "")
+    result["commands_run"] = [{
+        "command": display, "exit_code": code, "stdout_excerpt": clip(stdout), "stderr_excerpt": clip(stderr),
+    }]
+    if status != "success":
+        result["issues"] = [{"type": "error", "description": summary, "suggested_action": "Check the command output"}]
+    return result
+
+
+_codex_limiter: RateLimiter | None = None
+
+
+def _get_codex_limiter() -> RateLimiter:
+    """codex 任务的主机级限流器，与 codex-advisor 使用相同的令牌桶键和配置，共享同一模型的限额。"""
+    global _codex_limiter
+    if _codex_limiter is None:
+        _codex_limiter = RateLimiter(
+            DROID_CODEX_MODEL or "codex-default",
+            rpm=float(os.getenv("CODEX_RATE_LIMIT_RPM", "0")),
+            burst=int(os.getenv("CODEX_RATE_LIMIT_BURST", "5")),
+            max_sessions=int(os.getenv("CODEX_RATE_LIMIT_SESSIONS", "0")),
+            path=MCP_RATE_LIMIT_PATH,
+        )
+    return _codex_limiter
+
+
+def get_codex_cmd(read_only: bool, repo_root: str | None, output_path: str) -> list[str]:
+    """构建 codex exec 命令：只读任务使用 read-only 沙箱，其余使用 workspace-write。"""
+    if DROID_CODEX_CMD:
+        cmd = DROID_CODEX_CMD.split()
+    else:
+        cmd = ["codex", "exec", "--sandbox", "read-only" if read_only else "workspace-write", "--skip-git-repo-check"]
+        if DROID_CODEX_MODEL:
+            cmd.extend(["--model", DROID_CODEX_MODEL])
+    if repo_root:
+        cmd.extend(["--cd", repo_root])
+    cmd.extend(["--output-last-message", output_path])
+    return cmd
+
+
+async def call_codex_async(payload: dict[str, Any], on_event: EventCallback | None = None) -> dict[str, Any]:
+    """用 Codex CLI 执行任务，提示词与 droid 相同；最终回复按 droid 的 JSON 输出格式解析。"""
+    if not (payload.get("objective") or "").strip():
+        return error_result("error", "Objective 不能为空")
+    timeout = payload.get("timeout") or DROID_CODEX_TIMEOUT
+    fd, output_path = tempfile.mkstemp(prefix="droid-codex-", suffix=".txt")
+    os.close(fd)
+    try:
+        cmd = [*get_codex_cmd(bool(payload.get("read_only")), _repo_root(payload), output_path), build_prompt(payload)]
+        async with _get_codex_limiter().slot():
+            try:
+                code, stdout, stderr = await _run_process(cmd, None, timeout)
+            except FileNotFoundError:
+                return error_result("error", "Codex CLI not found")
+        if code is None:
+            return error_result("timeout", f"Codex 执行超时（{timeout}秒）", stdout, stderr)
+        if code != 0:
+            return error_result("failed", f"Codex CLI failed with code {code}", stdout, stderr)
+        with open(output_path) as f:
+            message = f.read().strip() or stdout
+        # 最终回复不是 JSON 时整条作为 summary（同 droid 的 result 字段）；合并执行时各任务结果从中拆分
+        data = parse_json(message) or {"summary": message}
+        result = normalize_output(data, message)
+        if isinstance(data.get("tasks"), list):
+            result["tasks"] = data["tasks"]
+        return result
+    finally:
+        os.unlink(output_path)
@@ -0,0 +1,52 @@
+"""Git helpers - 异步调用 git CLI"""
+import asyncio
+import os
+import tempfile
+
+
+async def run_git(root: str, *args: str, env: dict[str, str] | None = None, input: bytes | None = None) -> tuple[int, bytes, str]:
+    """在 root 中运行 git，返回 (退出码, stdout 原始字节, stderr)。未安装 git 时退出码为 127。"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "git", "-C", root, *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+        )
+    except FileNotFoundError:
+        return 127, b"", "git not found"
+    out, err = await proc.communicate(input)
+    return proc.returncode, out, err.decode(errors="replace")
+
+
+async def git_output(root: str, *args: str, env: dict[str, str] | None = None) -> str | None:
+    """运行 git 并返回去掉首尾空白的 stdout，失败返回 None。"""
+    code, out, _ = await run_git(root, *args, env=env)
+    return out.decode(errors="replace").strip() if code == 0 else None
+
+
+async def worktree_tree(root: str) -> str | None:
+    """工作区（含未提交和未跟踪文件，不含忽略文件）的 git tree 对象，非 git 仓库返回 None。
+
+    在真实 index 的临时副本上执行 add -A，不改动仓库状态，并复用 index 中的文件状态缓存。
+    """
+    index = await git_output(root, "rev-parse", "--git-path", "index")
+    if not index:
+        return None
+    index = os.path.join(root, index)
+    fd, tmp_index = tempfile.mkstemp(suffix=".index")
+    os.close(fd)
+    try:
+        try:
+            with open(index, "rb") as src, open(tmp_index, "wb") as dst:
+                dst.write(src.read())
+        except FileNotFoundError:
+            os.unlink(tmp_index)  # 尚无 index 的新仓库
+        env = {**os.environ, "GIT_INDEX_FILE": tmp_index}
+        if await git_output(root, "add", "-A", env=env) is None:
+            return None
+        return await git_output(root, "write-tree", env=env) or None
+    finally:
+        if os.path.exists(tmp_index):
+            os.unlink(tmp_index)
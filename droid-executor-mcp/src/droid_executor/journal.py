@@ -0,0 +1,158 @@
+"""Run journal - 追加写入的 DAG 任务状态日志，用于中断后按 run_id 恢复"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+# 环境变量配置
+DROID_JOURNAL = os.getenv("DROID_JOURNAL", "true").lower() == "true"  # 是否记录 DAG 运行日志
+DROID_JOURNAL_DIR = os.getenv("DROID_JOURNAL_DIR", str(Path.home() / ".cache" / "droid-executor" / "runs"))
+DROID_JOURNAL_MAX_RUNS = int(os.getenv("DROID_JOURNAL_MAX_RUNS", "100"))  # 保留的运行日志数，超出删除最旧的
+
+FLUSH_INTERVAL = 0.5  # 批量写入间隔（秒）
+_RUN_ID_RE = re.compile(r"^[\w-]+$")
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+def _journal_path(run_id: str, directory: str) -> Path | None:
+    return Path(directory, f"{run_id}.jsonl") if _RUN_ID_RE.match(run_id) else None
+
+
+class RunJournal:
+    """单次 DAG 运行的日志 - 记录先进缓冲区，定时批量追加到 <run_id>.jsonl。"""
+
+    def __init__(self, run_id: str, directory: str = DROID_JOURNAL_DIR, flush_interval: float = FLUSH_INTERVAL):
+        self.run_id = run_id
+        self.directory = directory
+        self.path = _journal_path(run_id, directory)
+        if self.path is None:
+            raise ValueError(f"Invalid run id: '{run_id}'")
+        self.flush_interval = flush_interval
+        self.buffer: list[str] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    def begin(self, task_defs: list[dict], context: dict):
+        """写入运行头；日志已存在（恢复运行）时追加 resume 记录。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.append({"type": "resume"})
+        else:
+            _prune(self.directory, DROID_JOURNAL_MAX_RUNS - 1)
+            self.append({"type": "run", "run_id": self.run_id, "tasks": task_defs, "context": context})
+        self.flush()
+
+    def task(self, task_id: str, status: str, result: dict[str, Any] | None = None):
+        record = {"type": "task", "id": task_id, "status": status}
+        if result is not None:
+            record["result"] = result
+        self.append(record)
+
+    def batch_error(self, task_ids: list[str], error: str):
+        """记录合并执行异常（这些任务随后单独执行）。"""
+        self.append({"type": "batch_error", "tasks": task_ids, "error": error})
+
+    def end(self, status: str):
+        self.append({"type": "end", "status": status})
+        self.flush()
+
+    def append(self, record: dict[str, Any]):
+        record["ts"] = round(time.time(), 3)
+        self.buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.buffer:
+            return
+        data = "\n".join(self.buffer) + "\n"
+        self.buffer.clear()
+        with open(self.path, "a") as f:
+            f.write(data)
+
+
+@dataclass
+class RunState:
+    """从日志重建的运行状态（每个任务取最后一次记录）"""
+    run_id: str
+    tasks: list[dict] = field(default_factory=list)
+    context: dict = field(default_factory=dict)
+    statuses: dict[str, str] = field(default_factory=dict)
+    results: dict[str, dict[str, Any]] = field(default_factory=dict)
+    started: float | None = None
+    updated: float | None = None
+    status: str | None = None  # 最后一次 end 记录的状态，None 表示运行被中断
+
+    def restorable(self, task_defs: list[dict]) -> dict[str, dict[str, Any]]:
+        """返回可直接复用的成功结果：任务已成功且定义与记录中一致。"""
+        recorded = {t.get("id"): t for t in self.tasks}
+        return {
+            t["id"]: self.results[t["id"]]
+            for t in task_defs
+            if self.statuses.get(t.get("id")) == "success" and recorded.get(t["id"]) == t
+        }
+
+    def summary(self) -> dict[str, Any]:
+        counts: dict[str, int] = {}
+        for status in self.statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        return {
+            "run_id": self.run_id,
+            "status": self.status or "interrupted",
+            "tasks": len(self.tasks),
+            "task_statuses": counts,
+            "started": self.started,
+            "updated": self.updated,
+        }
+
+
+def load_run(run_id: str, directory: str = DROID_JOURNAL_DIR) -> RunState | None:
+    """读取运行日志，不存在时返回 None；忽略写了一半的末行。"""
+    path = _journal_path(run_id, directory)
+    if path is None or not path.exists():
+        return None
+    state = RunState(run_id)
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            kind = record.get("type")
+            state.updated = record.get("ts", state.updated)
+            if kind == "run":
+                state.tasks = record.get("tasks", [])
+                state.context = record.get("context") or {}
+                state.started = record.get("ts")
+            elif kind == "resume":
+                state.status = None
+            elif kind == "task":
+                state.statuses[record["id"]] = record["status"]
+                if "result" in record:
+                    state.results[record["id"]] = record["result"]
+            elif kind == "end":
+                state.status = record.get("status")
+    return state
+
+
+def list_runs(directory: str = DROID_JOURNAL_DIR, limit: int = 20) -> list[dict[str, Any]]:
+    """按最近更新排序列出运行摘要。"""
+    paths = sorted(Path(directory).glob("*.jsonl"), key=lambda p: p.stat().st_mtime, reverse=True)
+    runs = (load_run(p.stem, directory) for p in paths[:limit])
+    return [run.summary() for run in runs if run]
+
+
+def _prune(directory: str, keep: int):
+    paths = sorted(Path(directory).glob("*.jsonl"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in paths[max(keep, 0):]:
+        path.unlink(missing_ok=True)
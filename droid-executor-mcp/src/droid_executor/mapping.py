@@ -0,0 +1,75 @@
+"""Map tasks - 按文件 glob、列表或上游结果展开的任务模板，分块后每块由一次 droid 调用处理"""
+import glob
+import os
+import shlex
+from typing import Any
+
+# 环境变量配置
+DROID_MAP_CHUNK_SIZE = int(os.getenv("DROID_MAP_CHUNK_SIZE", "1"))  # map 任务默认每块的条目数
+DROID_MAP_MAX_SHARDS = int(os.getenv("DROID_MAP_MAX_SHARDS", "500"))  # 单个 map 任务展开的分片上限
+
+
+def check_map_spec(task_id: str, spec: Any, depends_on: list[str]) -> dict[str, Any]:
+    """校验 map 定义，返回补全默认值后的副本；定义无效时抛出 ValueError。"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"Task '{task_id}': 'map' must be an object")
+    sources = [key for key in ("items", "glob", "from") if spec.get(key) is not None]
+    if len(sources) != 1:
+        raise ValueError(f"Task '{task_id}': 'map' needs exactly one of 'items', 'glob' or 'from'")
+    if "items" in sources and not isinstance(spec["items"], list):
+        raise ValueError(f"Task '{task_id}': 'map.items' must be a list")
+    if "from" in sources and spec["from"] not in depends_on:
+        raise ValueError(f"Task '{task_id}': 'map.from' task '{spec['from']}' must be listed in depends_on")
+    chunk_size = spec.get("chunk_size", DROID_MAP_CHUNK_SIZE)
+    if isinstance(chunk_size, bool) or not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError(f"Task '{task_id}': 'map.chunk_size' must be a positive integer")
+    # glob 和上游结果中的文件列表默认作为 files_of_interest（增量执行时按文件内容判断变化）
+    as_files = spec.get("as_files", "items" not in sources)
+    return {**spec, "chunk_size": chunk_size, "as_files": bool(as_files)}
+
+
+def map_items(spec: dict[str, Any], root: str, upstream: dict[str, Any] | None = None) -> list[str]:
+    """解析 map 的条目列表（去重并保持顺序）。
+
+    glob 相对 root 匹配（支持 **），按路径排序；from 取上游结果的 items 字段，没有时取其 files_changed 路径。
+    """
+    if spec.get("glob") is not None:
+        patterns = spec["glob"] if isinstance(spec["glob"], list) else [spec["glob"]]
+        items = [path for pattern in patterns for path in sorted(glob.glob(pattern, root_dir=root, recursive=True))]
+    elif spec.get("from") is not None:
+        upstream = upstream or {}
+        if isinstance(upstream.get("items"), list):
+            items = upstream["items"]
+        else:
+            items = [f.get("path", "") if isinstance(f, dict) else f for f in upstream.get("files_changed") or []]
+    else:
+        items = spec["items"]
+    return list(dict.fromkeys(str(item) for item in items if item not in (None, "")))
+
+
+def chunked(items: list[str], size: int) -> list[list[str]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def render(template: str, items: list[str]) -> str:
+    """把模板中的 {items}（逗号分隔的全部条目）和 {item}（首个条目）替换为分块内容。"""
+    return template.replace("{items}", ", ".join(items)).replace("{item}", items[0] if items else "")
+
+
+def render_command(command: str | list[str], items: list[str]) -> str | list[str]:
+    """替换 shell 命令中的占位符：字符串命令中条目经 shell 转义；参数列表中单独的 "{items}" 展开为多个参数。"""
+    if isinstance(command, str):
+        return command.replace("{items}", shlex.join(items)).replace("{item}", shlex.quote(items[0]) if items else "")
+    rendered = []
+    for part in command:
+        if part == "{items}":
+            rendered.extend(items)
+        else:
+            rendered.append(render(part, items))
+    return rendered
+
+
+def lists_items(chunk_size: int, *templates: str) -> bool:
+    """模板是否已写出分块的全部条目；否则分片指令末尾会追加条目列表。"""
+    text = "".join(t or "" for t in templates)
+    return "{items}" in text or (chunk_size == 1 and "{item}" in text)
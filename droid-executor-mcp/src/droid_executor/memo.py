@@ -0,0 +1,141 @@
+"""Task memo - 增量执行 DAG：输入未变化的任务直接复用上次成功的结果"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from .gitutil import worktree_tree
+
+# 环境变量配置
+DROID_DAG_CACHE = os.getenv("DROID_DAG_CACHE", "false").lower() == "true"  # execute_dag 默认是否增量执行
+DROID_DAG_CACHE_PATH = os.getenv(
+    "DROID_DAG_CACHE_PATH", str(Path.home() / ".cache" / "droid-executor" / "task-results.sqlite3")
+)
+DROID_DAG_CACHE_TTL = int(os.getenv("DROID_DAG_CACHE_TTL", "604800"))  # 过期时间（秒），默认 7 天
+DROID_DAG_CACHE_MAX_ENTRIES = int(os.getenv("DROID_DAG_CACHE_MAX_ENTRIES", "1000"))  # 超出后按 LRU 淘汰
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def task_key(definition: dict[str, Any], upstream: dict[str, dict[str, Any]], fingerprint: str) -> str:
+    """按任务定义、上游任务结果和输入指纹计算缓存键。"""
+    upstream = {tid: {k: v for k, v in result.items() if k != "cached"} for tid, result in upstream.items()}
+    return _digest([definition, upstream, fingerprint])
+
+
+def _hash_files(root: str, files: list[str]) -> str:
+    h = hashlib.sha256()
+    for name in sorted(set(files)):
+        path = Path(root, name)
+        h.update(name.encode() + b"\0")
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            h.update(b"<missing>")
+        h.update(b"\0")
+    return "files:" + h.hexdigest()
+
+
+async def fingerprint_inputs(repo_root: str | None, files: list[str]) -> str | None:
+    """计算任务输入指纹：声明了 files_of_interest 时取这些文件的内容，否则取整个工作区的 tree 哈希。
+
+    无法确定输入时返回 None，此时任务不参与缓存。
+    """
+    root = repo_root or os.getcwd()
+    if files:
+        return await asyncio.to_thread(_hash_files, root, files)
+    tree = await worktree_tree(root)
+    return f"tree:{tree}" if tree else None
+
+
+class TaskResultCache:
+    """SQLite 任务结果缓存，支持 TTL 和按最近使用时间的容量淘汰。"""
+
+    def __init__(self, path: str = DROID_DAG_CACHE_PATH, ttl: int = DROID_DAG_CACHE_TTL, max_entries: int = DROID_DAG_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @contextmanager
+    def _connect(self):
+        """打开连接并在一个事务中执行，结束后关闭。"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS task_results ("
+                    " key TEXT PRIMARY KEY, task_id TEXT NOT NULL, value TEXT NOT NULL,"
+                    " created REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM task_results WHERE key = ? AND created >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE task_results SET last_used = ? WHERE key = ?", (now, key))
+        self.counters["hits" if row else "misses"] += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, task_id: str, value: dict[str, Any]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_results (key, task_id, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, task_id, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM task_results WHERE created < ?", (now - self.ttl,))
+            evicted = conn.execute(
+                "DELETE FROM task_results WHERE key IN ("
+                " SELECT key FROM task_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.counters["stores"] += 1
+        self.counters["evictions"] += max(evicted, 0)
+
+    def clear(self, task_id: str | None = None) -> int:
+        """清除全部缓存或指定任务 ID 的缓存，返回删除条数。"""
+        with self._connect() as conn:
+            if task_id is None:
+                return conn.execute("DELETE FROM task_results").rowcount
+            return conn.execute("DELETE FROM task_results WHERE task_id = ?", (task_id,)).rowcount
+
+    def stats(self) -> dict[str, Any]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM task_results").fetchone()[0]
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "path": self.path,
+        }
+
+
+_cache: TaskResultCache | None = None
+
+
+def get_task_cache() -> TaskResultCache:
+    """获取进程级任务结果缓存。"""
+    global _cache
+    if _cache is None:
+        _cache = TaskResultCache()
+    return _cache
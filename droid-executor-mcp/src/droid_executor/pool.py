@@ -0,0 +1,170 @@
+"""Execution Pool - 进程级共享执行池，限制 droid 子进程总数并在调用方之间公平调度"""
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Coroutine, Protocol
+
+from .adaptive import AdaptiveConcurrency
+from .resources import ResourceLedger
+
+# 配置（支持环境变量）
+MAX_WORKERS = int(os.getenv("DROID_MAX_WORKERS", "8"))  # 整个进程同时运行的任务上限（adaptive 模式下为初始值）
+CONCURRENCY = os.getenv("DROID_CONCURRENCY", "static")  # 并发模式: static, adaptive
+
+
+class PoolClient(Protocol):
+    """向执行池提交工作的调用方（DAG 或单任务）"""
+
+    def has_ready(self) -> bool: ...
+
+    def has_blocked(self) -> bool: ...  # 有就绪任务但都在等待资源
+
+    def take(self) -> Coroutine[Any, Any, Any]: ...
+
+
+class ExecutionPool:
+    """执行池 - 所有 DAG 与单任务共享的槽位，在有就绪任务的调用方之间轮转分配"""
+
+    def __init__(self, capacity: int = MAX_WORKERS, adaptive: AdaptiveConcurrency | None = None, resources: ResourceLedger | None = None):
+        self._capacity = max(1, capacity)
+        self.adaptive = adaptive
+        self.resources = resources or ResourceLedger()
+        self.running = 0
+        self._ready: deque[PoolClient] = deque()  # 有就绪任务、等待轮转的调用方
+        self._parked: list[PoolClient] = []  # 就绪任务都在等待资源的调用方，资源释放时重新加入轮转
+        self._jobs: set[asyncio.Task] = set()
+
+    @property
+    def capacity(self) -> int:
+        return self.adaptive.current if self.adaptive else self._capacity
+
+    def notify(self, client: PoolClient):
+        """调用方有新的就绪任务时调用"""
+        if client not in self._ready:
+            self._ready.append(client)
+        self._dispatch()
+
+    def remove(self, client: PoolClient):
+        """调用方结束后移出轮转"""
+        if client in self._ready:
+            self._ready.remove(client)
+        if client in self._parked:
+            self._parked.remove(client)
+
+    def release_resources(self, tags: list[str]):
+        """归还任务占用的资源，唤醒等待资源的调用方"""
+        self.resources.release(tags)
+        parked, self._parked = self._parked, []
+        for client in parked:
+            if client not in self._ready:
+                self._ready.append(client)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self.adaptive:
+            self.adaptive.adjust(self.running)
+        while self.running < self.capacity and self._ready:
+            client = self._ready.popleft()
+            if not client.has_ready():
+                self._park(client)
+                continue
+            self.running += 1
+            job = asyncio.create_task(client.take())
+            self._jobs.add(job)
+            job.add_done_callback(self._release)
+            # 轮转：取过任务的调用方排到队尾
+            if client.has_ready():
+                self._ready.append(client)
+            else:
+                self._park(client)
+
+    def _park(self, client: PoolClient):
+        if client.has_blocked() and client not in self._parked:
+            self._parked.append(client)
+
+    def _release(self, job: asyncio.Task):
+        """任务结束（含取消）后归还槽位并继续分配"""
+        self._jobs.discard(job)
+        self.running -= 1
+        if self.adaptive and not job.cancelled() and not job.exception():
+            if isinstance(result := job.result(), dict):
+                self.adaptive.record(result.get("status"))
+        self._dispatch()
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """在池中执行单个调用，与 DAG 任务共用准入控制"""
+        client = _SingleCall(fn, args)
+        self.notify(client)
+        try:
+            return await asyncio.shield(client.future)
+        except asyncio.CancelledError:
+            self.remove(client)
+            client.cancel()
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        stats = {
+            "capacity": self.capacity,
+            "running": self.running,
+            "waiting_clients": len(self._ready),
+            "resource_blocked_clients": len(self._parked),
+            "resources": self.resources.stats(),
+        }
+        if self.adaptive:
+            stats["adaptive"] = self.adaptive.stats()
+        return stats
+
+
+class _SingleCall:
+    """单次调用的 PoolClient 适配"""
+
+    def __init__(self, fn: Callable[..., Awaitable[Any]], args: tuple):
+        self.fn = fn
+        self.args = args
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: asyncio.Task | None = None
+        self.taken = False
+
+    def has_ready(self) -> bool:
+        return not self.taken and not self.future.done()
+
+    def has_blocked(self) -> bool:
+        return False
+
+    def take(self) -> Coroutine[Any, Any, Any]:
+        self.taken = True
+        return self._call()
+
+    async def _call(self):
+        self.task = asyncio.current_task()
+        try:
+            result = await self.fn(*self.args)
+        except asyncio.CancelledError:
+            if not self.future.done():
+                self.future.cancel()
+            raise
+        except Exception as exc:
+            if not self.future.done():
+                self.future.set_exception(exc)
+            return None
+        if not self.future.done():
+            self.future.set_result(result)
+        return result
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+        elif not self.future.done():
+            self.future.cancel()
+
+
+_pool: ExecutionPool | None = None
+
+
+def get_pool() -> ExecutionPool:
+    """获取进程级共享执行池"""
+    global _pool
+    if _pool is None:
+        adaptive = AdaptiveConcurrency(MAX_WORKERS) if CONCURRENCY == "adaptive" else None
+        _pool = ExecutionPool(adaptive=adaptive)
+    return _pool
@@ -0,0 +1,161 @@
+"""Subprocess helpers - 执行后端共用的子进程输出读取、进程组终止和结果规范化"""
+import asyncio
+import json
+import os
+import signal
+from collections import deque
+from typing import Any
+
+KILL_GRACE = 5  # SIGTERM 后等待进程组退出的秒数，超时则 SIGKILL
+OUTPUT_TAIL_CHARS = 64 * 1024  # stdout/stderr 各保留的尾部字符数
+MAX_LINE_BYTES = 1024 * 1024  # 单行上限，超出部分只保留行尾
+
+
+def clip(text: str | None, limit: int = 800) -> str:
+    if not text:
+        return ""
+    text = text.strip()
+    return text[-limit:] if len(text) > limit else text
+
+
+def parse_json(raw: str) -> dict | None:
+    """解析 Droid CLI JSON 输出。"""
+    if not raw.strip():
+        return None
+    try:
+        return json.loads(raw.strip())
+    except json.JSONDecodeError:
+        pass
+
+    for line in reversed(raw.strip().splitlines()):
+        line = line.strip()
+        if line.startswith('{') and line.endswith('}'):
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+class OutputTail:
+    """有界输出缓冲 - 只保留最近 limit 个字符"""
+
+    def __init__(self, limit: int = OUTPUT_TAIL_CHARS):
+        self.limit = limit
+        self.chunks: deque[str] = deque()
+        self.size = 0
+
+    def append(self, text: str):
+        self.chunks.append(text)
+        self.size += len(text)
+        while self.size - len(self.chunks[0]) >= self.limit:
+            self.size -= len(self.chunks.popleft())
+
+    def text(self) -> str:
+        return "".join(self.chunks)[-self.limit:]
+
+
+async def iter_lines(stream: asyncio.StreamReader):
+    """逐行读取子进程输出，超长行只保留行尾以限制内存"""
+    buf = b""
+    while chunk := await stream.read(65536):
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buf) > MAX_LINE_BYTES:
+            buf = buf[-MAX_LINE_BYTES:]
+    if buf:
+        yield buf
+
+
+async def drain(stream: asyncio.StreamReader, tail: OutputTail):
+    async for raw in iter_lines(stream):
+        tail.append(raw.decode(errors="replace") + "\n")
+
+
+def normalize_output(data: dict | None, stdout: str) -> dict[str, Any]:
+    """标准化输出格式。"""
+    base = {
+        "status": "success",
+        "summary": "",
+        "files_changed": [],
+        "commands_run": [],
+        "tests": {},
+        "logs": [],
+        "issues": [],
+    }
+
+    if not data:
+        base["summary"] = clip(stdout) or "Execution completed"
+        if stdout.strip():
+            base["logs"] = [clip(stdout)]
+        return base
+
+    # 支持官方 droid exec JSON 格式
+    if data.get("type") == "result":
+        base["status"] = "failed" if data.get("is_error") or data.get("subtype") == "error" else "success"
+        base["summary"] = data.get("result") or ""
+        if data.get("session_id"):
+            base["logs"].append(f"session_id: {data['session_id']}")
+        if data.get("duration_ms"):
+            base["logs"].append(f"duration: {data['duration_ms']}ms")
+    else:
+        base["status"] = data.get("status") or "success"
+        base["summary"] = data.get("summary") or data.get("message") or data.get("result") or ""
+
+    # 映射文件变更
+    for key in ["files_changed", "files", "changes"]:
+        if files := data.get(key):
+            base["files_changed"] = [
+                {"path": f if isinstance(f, str) else f.get("path", ""), "change_type": "modified", "highlights": []}
+                for f in files
+            ]
+            break
+
+    # 映射命令
+    for key in ["commands_run", "commands"]:
+        if cmds := data.get(key):
+            base["commands_run"] = [
+                {"command": c if isinstance(c, str) else c.get("command", ""), "exit_code": None if isinstance(c, str) else c.get("exit_code"), "stdout_excerpt": "", "stderr_excerpt": ""}
+                for c in cmds
+            ]
+            break
+
+    if not base["summary"]:
+        base["summary"] = clip(stdout) or "Execution completed"
+
+    return base
+
+
+def error_result(status: str, summary: str, stdout: str = "", stderr: str = "") -> dict[str, Any]:
+    """构建错误结果。"""
+    return {
+        "status": status,
+        "summary": summary,
+        "files_changed": [],
+        "commands_run": [],
+        "tests": {},
+        "logs": [item for item in [clip(stdout), clip(stderr)] if item],
+        "issues": [{"type": "error", "description": summary, "suggested_action": "Check Droid CLI logs"}],
+    }
+
+
+def signal_group(proc: asyncio.subprocess.Process, sig: int):
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def terminate(proc: asyncio.subprocess.Process):
+    """先 SIGTERM 再 SIGKILL 终止子进程组并回收"""
+    if proc.returncode is None:
+        signal_group(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=KILL_GRACE)
+        except asyncio.TimeoutError:
+            pass
+    # 主进程已退出时，组内可能仍有残留子进程
+    signal_group(proc, signal.SIGKILL)
+    await proc.wait()
@@ -0,0 +1,159 @@
+"""Rate limiter - 基于文件锁的跨进程令牌桶，按模型限制启动速率和同时运行的会话数"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any
+
+# 环境变量配置（MCP_RATE_LIMIT_PATH 与 codex-advisor 共用，同一主机上的进程共享限额）
+MCP_RATE_LIMIT_PATH = os.getenv(
+    "MCP_RATE_LIMIT_PATH", str(Path.home() / ".cache" / "mcp-rate-limit" / "limits.json")
+)
+DROID_RATE_LIMIT_RPM = float(os.getenv("DROID_RATE_LIMIT_RPM", "0"))  # 每分钟启动的 droid 进程上限，0 表示不限
+DROID_RATE_LIMIT_BURST = int(os.getenv("DROID_RATE_LIMIT_BURST", "5"))  # 令牌桶容量（允许的突发数）
+DROID_RATE_LIMIT_SESSIONS = int(os.getenv("DROID_RATE_LIMIT_SESSIONS", "0"))  # 同一模型同时运行的会话上限，0 表示不限
+
+POLL_INTERVAL = 0.5  # 会话名额已满时的重试间隔（秒）
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RateLimiter:
+    """跨进程限流器 - 状态保存在共享 JSON 文件中，每次读写都持有 flock 排他锁。
+
+    每个 key（模型）一个令牌桶，按 rpm 匀速补充；运行中的会话以租约记录，
+    持有进程退出后租约自动失效。取不到名额时排队等待而不是失败。
+    """
+
+    def __init__(
+        self,
+        key: str,
+        rpm: float = DROID_RATE_LIMIT_RPM,
+        burst: int = DROID_RATE_LIMIT_BURST,
+        max_sessions: int = DROID_RATE_LIMIT_SESSIONS,
+        path: str = MCP_RATE_LIMIT_PATH,
+    ):
+        self.key = key
+        self.rpm = rpm
+        self.burst = max(burst, 1)
+        self.max_sessions = max_sessions
+        self.path = path
+        self.waiting = 0
+        self.counters = {"acquired": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.max_sessions > 0
+
+    @contextmanager
+    def _locked(self):
+        """持有文件锁读写全部限流状态。"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                state = json.loads(f.read() or "{}")
+            except ValueError:
+                state = {}
+            yield state
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+
+    def _bucket(self, state: dict[str, Any], now: float) -> dict[str, Any]:
+        bucket = state.setdefault(self.key, {"tokens": float(self.burst), "updated": now, "leases": {}})
+        bucket["leases"] = {lease: pid for lease, pid in bucket["leases"].items() if _alive(pid)}
+        if self.rpm > 0:
+            elapsed = max(now - bucket["updated"], 0)
+            bucket["tokens"] = min(float(self.burst), bucket["tokens"] + elapsed * self.rpm / 60)
+        bucket["updated"] = now
+        return bucket
+
+    def _try_acquire(self, lease: str) -> float:
+        """尝试取得一个令牌和会话名额，成功返回 0，否则返回建议的等待秒数。"""
+        with self._locked() as state:
+            bucket = self._bucket(state, time.time())
+            if self.max_sessions and len(bucket["leases"]) >= self.max_sessions:
+                return POLL_INTERVAL
+            if self.rpm > 0:
+                if bucket["tokens"] < 1:
+                    return (1 - bucket["tokens"]) * 60 / self.rpm
+                bucket["tokens"] -= 1
+            bucket["leases"][lease] = os.getpid()
+            return 0.0
+
+    def _release(self, lease: str):
+        with self._locked() as state:
+            self._bucket(state, time.time())["leases"].pop(lease, None)
+
+    @asynccontextmanager
+    async def slot(self):
+        """排队直到取得名额，退出时归还会话名额。"""
+        if not self.enabled:
+            yield
+            return
+
+        lease = uuid.uuid4().hex
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            while (delay := self._try_acquire(lease)) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.counters["acquired"] += 1
+        if waited >= 0.01:
+            self.counters["queued"] += 1
+        self.counters["wait_seconds"] += waited
+        self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+        try:
+            yield
+        finally:
+            self._release(lease)
+
+    def stats(self) -> dict[str, Any]:
+        stats = {
+            "key": self.key,
+            "enabled": self.enabled,
+            "rpm": self.rpm,
+            "burst": self.burst,
+            "max_sessions": self.max_sessions,
+            "waiting": self.waiting,
+            **self.counters,
+        }
+        acquired = self.counters["acquired"]
+        stats["avg_wait_seconds"] = round(self.counters["wait_seconds"] / acquired, 3) if acquired else None
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        if self.enabled:
+            with self._locked() as state:
+                bucket = self._bucket(state, time.time())
+            stats["host_sessions"] = len(bucket["leases"])
+            stats["host_tokens"] = round(bucket["tokens"], 2)
+        return stats
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_limiter() -> RateLimiter:
+    """获取进程级限流器，按 DROID_MODEL 区分令牌桶。"""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(os.getenv("DROID_MODEL") or "droid-default")
+    return _limiter
@@ -0,0 +1,67 @@
+"""Resource slots - 任务声明的资源标签及容量，占用同一资源的任务串行执行，其余任务照常并行"""
+import os
+from collections import Counter
+from typing import Any, Iterable
+
+# 环境变量配置
+DROID_RESOURCE_LIMITS = os.getenv("DROID_RESOURCE_LIMITS", "")  # 资源容量，如 "test-suite=1,gpu-free-cpu-heavy=2"；未列出的资源容量为 1
+
+
+def parse_limits(spec: str) -> dict[str, int]:
+    """解析 "name=N,name=N" 形式的资源容量，格式错误时抛出 ValueError。"""
+    limits: dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, value = item.rpartition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid resource limit: '{item}' (expected name=N)")
+        limits[name.strip()] = int(value)
+    return check_limits(limits)
+
+
+def check_limits(limits: dict[str, Any]) -> dict[str, int]:
+    """校验资源容量（正整数），返回规范化后的副本。"""
+    checked = {}
+    for name, value in limits.items():
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f"Resource limit for '{name}' must be a positive integer, got {value!r}")
+        checked[str(name)] = value
+    return checked
+
+
+class ResourceLedger:
+    """进程级资源占用表 - 所有 DAG 共享，同一资源的占用数不超过其容量。
+
+    资源标签是任意字符串（如 exclusive:repo-write、port:8080），每个声明它的任务占用一个单位；
+    容量取调用方传入的覆盖值，其次 DROID_RESOURCE_LIMITS，默认 1（互斥）。
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None):
+        self.limits = limits if limits is not None else parse_limits(DROID_RESOURCE_LIMITS)
+        self.in_use: Counter[str] = Counter()
+        self.counters = {"acquired": 0, "deferred": 0}  # deferred: 因资源占满而被跳过的出队次数
+
+    def capacity(self, name: str, overrides: dict[str, int] | None = None) -> int:
+        if overrides and name in overrides:
+            return overrides[name]
+        return self.limits.get(name, 1)
+
+    def available(self, tags: Iterable[str], overrides: dict[str, int] | None = None) -> bool:
+        return all(self.in_use[name] < self.capacity(name, overrides) for name in tags)
+
+    def acquire(self, tags: Iterable[str]):
+        for name in tags:
+            self.in_use[name] += 1
+        self.counters["acquired"] += 1
+
+    def release(self, tags: Iterable[str]):
+        for name in tags:
+            self.in_use[name] -= 1
+            if self.in_use[name] <= 0:
+                del self.in_use[name]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.counters,
+            "in_use": dict(self.in_use),
+            "limits": dict(self.limits),
+        }
@@ -0,0 +1,117 @@
+"""Background runs - 后台执行的 DAG 运行，支持按 run_id 查询进度、取结果和取消"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from .journal import load_run
+from .scheduler import DAGScheduler
+
+MAX_FINISHED_RUNS = 50  # 内存中保留的已结束运行数，更早的只能从运行日志查询
+
+
+@dataclass
+class BackgroundRun:
+    run_id: str
+    scheduler: DAGScheduler
+    job: asyncio.Task | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    finished_at: float | None = None
+    created: float = field(default_factory=time.time)
+
+    @property
+    def running(self) -> bool:
+        return self.result is None and self.error is None
+
+
+class RunRegistry:
+    """进程内的后台 DAG 运行表"""
+
+    def __init__(self, max_finished: int = MAX_FINISHED_RUNS):
+        self.max_finished = max_finished
+        self.runs: dict[str, BackgroundRun] = {}
+
+    def start(self, run_id: str, scheduler: DAGScheduler, tasks: list[dict], restored: dict[str, dict] | None = None) -> BackgroundRun:
+        run = self.runs[run_id] = BackgroundRun(run_id, scheduler)
+        run.job = asyncio.create_task(self._run(run, tasks, restored))
+        return run
+
+    async def _run(self, run: BackgroundRun, tasks: list[dict], restored: dict[str, dict] | None):
+        try:
+            run.result = await run.scheduler.submit(tasks, restored)
+        except asyncio.CancelledError:
+            run.error = "cancelled"  # 服务关闭
+            raise
+        except Exception as exc:
+            run.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            run.finished_at = time.time()
+            self._evict()
+
+    def _evict(self):
+        finished = sorted((r for r in self.runs.values() if not r.running), key=lambda r: r.finished_at or 0)
+        for run in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.runs[run.run_id]
+
+    def status(self, run_id: str) -> dict[str, Any] | None:
+        """运行状态；不在内存中时从运行日志重建（服务重启前的运行）。"""
+        if run := self.runs.get(run_id):
+            snapshot = run.scheduler.snapshot()
+            if run.running:
+                status = "running"
+            else:
+                status = run.result["status"] if run.result else "error"
+            info = {"run_id": run_id, "status": status, **snapshot}
+            if run.result:
+                for key in ("skipped", "failed", "cancelled", "cached", "resumed"):
+                    info[key] = run.result.get(key, [])
+                info["duration_ms"] = run.result.get("duration_ms")
+            if run.error:
+                info["error"] = run.error
+            return info
+
+        state = load_run(run_id)
+        if state is None:
+            return None
+        info = state.summary()
+        info["tasks"] = {t.get("id"): {"status": state.statuses.get(t.get("id"), "pending")} for t in state.tasks}
+        return info
+
+    def task_result(self, run_id: str, task_id: str) -> dict[str, Any] | None:
+        """单个任务的状态和结果（未结束时不含 result）；run 或任务不存在时返回 None。"""
+        if run := self.runs.get(run_id):
+            task = run.scheduler.tasks.get(task_id)
+            if task is None:
+                return None
+            info = {"run_id": run_id, "task_id": task_id, "status": task.status.value}
+            if task.result:
+                info["result"] = task.result
+            return info
+
+        state = load_run(run_id)
+        if state is None or task_id not in {t.get("id") for t in state.tasks}:
+            return None
+        info = {"run_id": run_id, "task_id": task_id, "status": state.statuses.get(task_id, "pending")}
+        if task_id in state.results:
+            info["result"] = state.results[task_id]
+        return info
+
+    def cancel(self, run_id: str) -> bool:
+        """取消运行中的 DAG，返回是否执行了取消。"""
+        run = self.runs.get(run_id)
+        if run is None or not run.running:
+            return False
+        run.scheduler.cancel()
+        return True
+
+
+_registry: RunRegistry | None = None
+
+
+def get_runs() -> RunRegistry:
+    """获取进程级后台运行表。"""
+    global _registry
+    if _registry is None:
+        _registry = RunRegistry()
+    return _registry
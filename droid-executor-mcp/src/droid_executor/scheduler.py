@@ -1,14 +1,28 @@
-"""DAG Scheduler - 任务队列 + Worker Pool 实现并行执行"""
+"""DAG Scheduler - 就绪队列 + 共享执行池实现并行执行"""
 import asyncio
+import heapq
 import time
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any
 import os
 
+from .batching import DROID_BATCH_MAX_COST, DROID_BATCH_MAX_TASKS, batch_payload, split_batch_result
+from .executors import check_executor
+from .journal import RunJournal
+from .mapping import DROID_MAP_MAX_SHARDS, check_map_spec, chunked, lists_items, map_items, render, render_command
+from .memo import fingerprint_inputs, get_task_cache, task_key
+from .pool import ExecutionPool, get_pool
+from .worktrees import WorktreeIsolation
+
 # 配置（支持环境变量）
-MAX_WORKERS = int(os.getenv("DROID_MAX_WORKERS", "8"))
 DAG_TIMEOUT = int(os.getenv("DROID_DAG_TIMEOUT", "3600"))  # 60 分钟整体超时
+SCHEDULING = os.getenv("DROID_SCHEDULING", "critical_path")  # 就绪任务排序: critical_path, fifo
+
+BATCH_SCAN = 64  # 组批时在就绪队列中向后查找的任务数上限
+
+# 历史执行时长（秒，指数滑动平均），用于估算关键路径
+_duration_history: dict[tuple[str, str], float] = {}
 
 
 class TaskStatus(Enum):
@@ -19,6 +33,7 @@ class TaskStatus(Enum):
     FAILED = "failed"
     SKIPPED = "skipped"
     TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
 
 
 @dataclass
@@ -29,24 +44,200 @@ class Task:
     depends_on: list[str] = field(default_factory=list)
     constraints: list[str] = field(default_factory=list)
     acceptance_criteria: list[str] = field(default_factory=list)
+    estimated_cost: float | None = None  # 预估耗时（任意单位），用于关键路径权重
+    priority: float | None = None  # 显式优先级，越大越先执行，优先于关键路径排序
+    timeout: int | None = None  # 单任务超时秒数，默认使用 DROID_TIMEOUT
+    read_only: bool = False  # 只读任务，不修改仓库
+    hedge: bool | None = None  # 只读任务是否对冲慢执行，默认 DROID_HEDGE
+    coalesce: bool | None = None  # 是否与进行中的相同任务合并，默认 DROID_SINGLE_FLIGHT
+    files_of_interest: list[str] = field(default_factory=list)  # 任务自身的输入文件，追加到共享上下文
+    cache: bool = True  # 增量执行时是否允许复用缓存结果
+    resources: list[str] = field(default_factory=list)  # 资源标签，占用同一资源的任务不超过其容量
+    batch: bool = True  # 启用合并执行时是否允许与其他小任务合并
+    executor: str = "droid"  # 执行后端: droid, codex, shell
+    command: str | list[str] | None = None  # shell 后端运行的命令
+    map: dict[str, Any] | None = None  # map 模板：依赖完成后展开为分片任务，本任务等待全部分片
+    reduce: dict[str, Any] | None = None  # 分片全部成功后执行的汇总任务定义
+    shards: list[str] | None = None  # 已展开的分片 ID（None 表示尚未展开）
+    group: str | None = None  # 分片所属的 map 任务
+    map_error: str | None = None  # 展开失败的原因
+    batch_error: str | None = None  # 合并执行抛出的异常，随后单独执行的结果中附带
     status: TaskStatus = TaskStatus.PENDING
     result: dict[str, Any] = field(default_factory=dict)
+    started: float | None = None  # 开始执行的时间（monotonic）
+    finished: float | None = None  # 执行结束的时间（monotonic）
 
 
-class DAGScheduler:
-    """DAG 调度器 - 管理任务队列和 Worker Pool"""
+@dataclass
+class DAGPlan:
+    """DAG 校验结果，同时携带调度所需的索引"""
+    order: list[str] = field(default_factory=list)  # 拓扑序（依赖在前）
+    levels: dict[str, int] = field(default_factory=dict)  # 任务所在层级（0 = 无依赖）
+    level_widths: list[int] = field(default_factory=list)  # 每层任务数
+    dependents: dict[str, list[str]] = field(default_factory=dict)  # 反向依赖索引
+    indegree: dict[str, int] = field(default_factory=dict)  # 去重后的依赖数
+    unknown: list[tuple[str, str]] = field(default_factory=list)  # (任务, 未知依赖)
+    cycle: list[str] = field(default_factory=list)  # 环路径，首尾相同
+
+    @property
+    def error(self) -> str | None:
+        errors = [f"Task '{tid}' depends on unknown task '{dep}'" for tid, dep in self.unknown]
+        if self.cycle:
+            errors.append("DAG contains cycle: " + " -> ".join(self.cycle))
+        return "; ".join(errors) or None
+
+
+def plan_dag(tasks: dict[str, Task]) -> DAGPlan:
+    """迭代式 Kahn 算法校验 DAG，O(V+E)。
+
+    一次遍历收集全部未知依赖，存在环时返回具体环路径，
+    并顺带产出拓扑序、层级宽度和反向依赖索引供调度器复用。
+    """
+    plan = DAGPlan(dependents={tid: [] for tid in tasks})
+    for task in tasks.values():
+        deps = dict.fromkeys(task.depends_on)  # 去重并保持顺序
+        count = 0
+        for dep in deps:
+            if dep not in tasks:
+                plan.unknown.append((task.id, dep))
+                continue
+            plan.dependents[dep].append(task.id)
+            count += 1
+        plan.indegree[task.id] = count
+
+    remaining = dict(plan.indegree)
+    frontier = [tid for tid, n in remaining.items() if not n]
+    for tid in frontier:
+        plan.levels[tid] = 0
+    while frontier:
+        plan.level_widths.append(len(frontier))
+        plan.order.extend(frontier)
+        next_frontier = []
+        for tid in frontier:
+            for dependent_id in plan.dependents[tid]:
+                remaining[dependent_id] -= 1
+                if not remaining[dependent_id]:
+                    plan.levels[dependent_id] = len(plan.level_widths)
+                    next_frontier.append(dependent_id)
+        frontier = next_frontier
+
+    if len(plan.order) < len(tasks):
+        plan.cycle = _find_cycle(tasks, remaining)
+    return plan
+
+
+def _find_cycle(tasks: dict[str, Task], remaining: dict[str, int]) -> list[str]:
+    """在 Kahn 算法未能排出的任务中找出一条环。
+
+    未排出的任务至少有一个未排出的依赖，沿依赖边走下去必然回到走过的节点。
+    """
+    tid = next(tid for tid, n in remaining.items() if n)
+    path: list[str] = []
+    position: dict[str, int] = {}
+    while tid not in position:
+        position[tid] = len(path)
+        path.append(tid)
+        tid = next(dep for dep in tasks[tid].depends_on if remaining.get(dep))
+    return path[position[tid]:] + [tid]
+
+
+def _clip(text: str | None, limit: int = 200) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
 
-    def __init__(self, executor_fn, context: dict | None = None):
+def _resource_tags(value: Any) -> list[str]:
+    """规范化任务的资源标签：接受单个字符串或列表，去重并保持顺序"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return list(dict.fromkeys(str(tag) for tag in value))
+
+
+def _history_key(task: Task) -> tuple[str, str]:
+    return (task.id, task.objective)
+
+
+def record_duration(task: Task, seconds: float):
+    """记录成功任务的执行时长"""
+    key = _history_key(task)
+    prev = _duration_history.get(key)
+    _duration_history[key] = seconds if prev is None else 0.7 * prev + 0.3 * seconds
+
+
+def critical_path_ranks(tasks: dict[str, Task], plan: DAGPlan) -> dict[str, float]:
+    """按逆拓扑序计算每个任务到 DAG 终点的最长剩余路径（含自身）。
+
+    权重依次取 estimated_cost、历史时长，都没有时按 1 计。
+    """
+    ranks: dict[str, float] = {}
+    for tid in reversed(plan.order):
+        ranks[tid] = task_weight(tasks[tid]) + max((ranks[d] for d in plan.dependents[tid]), default=0.0)
+    return ranks
+
+
+def task_weight(task: Task) -> float:
+    """任务权重：estimated_cost，其次历史时长，都没有时按 1 计"""
+    if task.estimated_cost is not None:
+        return task.estimated_cost
+    return _duration_history.get(_history_key(task), 1.0)
+
+
+class DAGScheduler:
+    """DAG 调度器 - 管理就绪队列，任务由共享执行池分配槽位执行"""
+
+    def __init__(
+        self,
+        executor_fn,
+        context: dict | None = None,
+        scheduling: str | None = None,
+        pool: ExecutionPool | None = None,
+        fail_fast: bool = False,
+        on_progress=None,
+        incremental: bool = False,
+        journal: RunJournal | None = None,
+        isolation: WorktreeIsolation | None = None,
+        resource_limits: dict[str, int] | None = None,
+        batching: bool = False,
+        batch_max_tasks: int = DROID_BATCH_MAX_TASKS,
+        batch_max_cost: float = DROID_BATCH_MAX_COST,
+    ):
         self.executor_fn = executor_fn  # async callable
         self.context = context or {}
+        self.scheduling = scheduling or SCHEDULING
+        self.fail_fast = fail_fast  # 首个任务失败即取消整个 DAG
+        self.on_progress = on_progress  # async (done, total)，每个任务结束时调用
+        self.incremental = incremental  # 输入未变化的任务复用上次成功的结果
+        self.journal = journal  # 任务状态变化写入运行日志
+        self.isolation = isolation  # 每个任务在独立 worktree 中执行
+        self.resource_limits = resource_limits or {}  # 本 DAG 的资源容量，覆盖 DROID_RESOURCE_LIMITS
+        self.batching = batching  # 把兼容的小就绪任务合并为一次执行
+        self.batch_max_tasks = batch_max_tasks
+        self.batch_max_cost = batch_max_cost
+        self.batches: list[list[str]] = []  # 合并执行过的任务组
+        self.timed_out = False
+        self.cancelled = False
+        self.started: float | None = None
+        self.pool = pool or get_pool()
         self.tasks: dict[str, Task] = {}
-        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self.ready: list[tuple[float, float, int, str]] = []  # 就绪任务小顶堆
+        self.running: set[asyncio.Task] = set()
+        self.ranks: dict[str, float] = {}  # 关键路径长度
+        self._seq = 0  # 同优先级按入队顺序
         self.completed: set[str] = set()
-        self.lock = asyncio.Lock()
+        self.plan = DAGPlan()
+        self.dependents: dict[str, list[str]] = {}  # 反向依赖索引: task_id -> 依赖它的任务
+        self.remaining: dict[str, int] = {}  # 每个任务尚未成功完成的依赖数
+        self.done = asyncio.Event()  # 最后一个任务结束时触发
+
+    async def submit(self, task_defs: list[dict], restored: dict[str, dict] | None = None) -> dict[str, Any]:
+        """提交 DAG 任务并等待完成
 
-    async def submit(self, task_defs: list[dict]) -> dict[str, Any]:
-        """提交 DAG 任务并等待完成"""
+        restored: 恢复运行时已成功任务的结果，这些任务不再执行，直接释放后续任务
+        """
         start_time = time.time()
+        self.started = time.monotonic()
 
         # 解析任务（检查重复 ID）
         seen_ids = set()
@@ -65,143 +256,540 @@ class DAGScheduler:
                 depends_on=t.get("depends_on", []),
                 constraints=t.get("constraints", []),
                 acceptance_criteria=t.get("acceptance_criteria", []),
+                estimated_cost=t.get("estimated_cost"),
+                priority=t.get("priority"),
+                timeout=t.get("timeout"),
+                read_only=bool(t.get("read_only", False)),
+                hedge=t.get("hedge"),
+                coalesce=t.get("coalesce"),
+                files_of_interest=t.get("files_of_interest", []),
+                cache=bool(t.get("cache", True)),
+                resources=_resource_tags(t.get("resources")),
+                reduce=t.get("reduce"),
+                batch=bool(t.get("batch", True)),
+                executor=t.get("executor") or "droid",
+                command=t.get("command"),
             )
+            try:
+                check_executor(tid, task.executor, task.command)
+                if t.get("map") is not None:
+                    task.map = check_map_spec(tid, t["map"], task.depends_on)
+                if task.reduce is not None and (task.map is None or not isinstance(task.reduce, dict)):
+                    raise ValueError(f"Task '{tid}': 'reduce' must be an object on a task with 'map'")
+                if task.reduce is not None:
+                    check_executor(f"{tid}.reduce", task.reduce.get("executor") or "droid", task.reduce.get("command"))
+            except ValueError as exc:
+                return {"status": "failed", "error": str(exc), "results": {}, "skipped": [], "failed": []}
             self.tasks[task.id] = task
 
-        # 验证依赖
-        if err := self._validate_dag():
-            return {"status": "failed", "error": err, "results": {}, "skipped": [], "failed": []}
+        # 验证依赖，复用校验产出的反向依赖索引
+        self.plan = plan_dag(self.tasks)
+        if err := self.plan.error:
+            return {
+                "status": "failed", "error": err, "results": {}, "skipped": [], "failed": [],
+                "unknown_dependencies": [{"task": tid, "depends_on": dep} for tid, dep in self.plan.unknown],
+                "cycle": self.plan.cycle,
+            }
 
-        # 入队无依赖任务
-        for task in self.tasks.values():
-            if not task.depends_on:
-                task.status = TaskStatus.QUEUED
-                await self.queue.put(task.id)
+        if self.isolation:
+            try:
+                await self.isolation.start(max(self.plan.level_widths, default=1))
+            except (ValueError, RuntimeError) as exc:
+                return {"status": "failed", "error": str(exc), "results": {}, "skipped": [], "failed": []}
+        if self.journal:
+            self.journal.begin(task_defs, self.context)
+
+        # 恢复已成功的任务
+        self.dependents = self.plan.dependents
+        self.remaining = dict(self.plan.indegree)
+        for tid, result in (restored or {}).items():
+            task = self.tasks[tid]
+            task.status = TaskStatus.SUCCESS
+            task.result = {**{k: v for k, v in result.items() if k != "cached"}, "resumed": True}
+            self.completed.add(tid)
+            for dependent_id in self.dependents[tid]:
+                self.remaining[dependent_id] -= 1
 
-        # 启动 Workers
-        workers = [
-            asyncio.create_task(self._worker(i))
-            for i in range(min(MAX_WORKERS, len(self.tasks)))
-        ]
+        # 入队无依赖任务
+        if self.scheduling == "critical_path":
+            self.ranks = critical_path_ranks(self.tasks, self.plan)
+        for task in list(self.tasks.values()):
+            if task.status == TaskStatus.PENDING and not self.remaining[task.id]:
+                self._enqueue(task.id)
+        if len(self.completed) == len(self.tasks):
+            self.done.set()
+        self.pool.notify(self)
 
         # 等待完成或超时
+        merged = None
         try:
-            await asyncio.wait_for(self._wait_all(), timeout=DAG_TIMEOUT)
+            await asyncio.wait_for(self.done.wait(), timeout=DAG_TIMEOUT)
         except asyncio.TimeoutError:
-            for task in self.tasks.values():
-                if task.status in (TaskStatus.PENDING, TaskStatus.QUEUED):
-                    task.status = TaskStatus.TIMEOUT
-
-        # 取消 Workers
-        for w in workers:
-            w.cancel()
-
-        return self._build_result(time.time() - start_time)
+            self.timed_out = True
+            self._abort(TaskStatus.TIMEOUT)
+        finally:
+            # 正常结束时为空操作；调用方断开时取消剩余任务
+            self._abort(TaskStatus.CANCELLED)
+            self.pool.remove(self)
+            if self.journal:
+                self.journal.flush()
+            # 等待被取消的任务终止各自的 droid 进程
+            if self.running:
+                await asyncio.gather(*self.running, return_exceptions=True)
+            if self.isolation:
+                merged = await self.isolation.finish()
+
+        result = self._build_result(time.time() - start_time)
+        if merged is not None:
+            result["isolation"] = merged
+        if self.journal:
+            self.journal.end(result["status"])
+            result["run_id"] = self.journal.run_id
+        return result
+
+    def _set_status(self, task: Task, status: TaskStatus, result: dict[str, Any] | None = None):
+        task.status = status
+        if self.journal:
+            self.journal.task(task.id, status.value, result)
+
+    def cancel(self):
+        """取消整个 DAG：运行中的任务被终止，submit 正常返回结果"""
+        self.cancelled = True
+        self._abort(TaskStatus.CANCELLED)
+
+    def snapshot(self) -> dict[str, Any]:
+        """当前进度：每个任务的状态和耗时、各状态计数和就绪队列深度"""
+        now = time.monotonic()
+        tasks = {}
+        counts: dict[str, int] = {}
+        for task in self.tasks.values():
+            info: dict[str, Any] = {"status": task.status.value}
+            if task.started is not None:
+                info["elapsed_ms"] = int(((task.finished or now) - task.started) * 1000)
+            if task.result.get("cached") or task.result.get("resumed"):
+                info["reused"] = True
+            tasks[task.id] = info
+            counts[task.status.value] = counts.get(task.status.value, 0) + 1
+        return {
+            "elapsed_ms": int((now - self.started) * 1000) if self.started else 0,
+            "tasks": tasks,
+            "counts": counts,
+            "queue_depth": len(self.ready),
+            "resource_blocked": sum(not self._runnable(tid) for *_, tid in self.ready),
+            "running": len(self.running),
+        }
 
-    def _validate_dag(self) -> str | None:
-        """验证 DAG 无环且依赖存在"""
+    def _abort(self, status: TaskStatus):
+        """停止 DAG：未开始和运行中的任务标记为 status，并取消运行中的任务"""
         for task in self.tasks.values():
-            for dep in task.depends_on:
-                if dep not in self.tasks:
-                    return f"Task '{task.id}' depends on unknown task '{dep}'"
-
-        # 检测环
-        visited, rec_stack = set(), set()
-
-        def has_cycle(tid: str) -> bool:
-            visited.add(tid)
-            rec_stack.add(tid)
-            for dep in self.tasks[tid].depends_on:
-                if dep not in visited and has_cycle(dep):
-                    return True
-                if dep in rec_stack:
-                    return True
-            rec_stack.remove(tid)
-            return False
-
-        for tid in self.tasks:
-            if tid not in visited and has_cycle(tid):
-                return "DAG contains cycle"
-        return None
-
-    async def _worker(self, worker_id: int):
-        """Worker 协程 - 从队列取任务执行"""
+            if task.status in (TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING):
+                self._set_status(task, status)
+        self.ready.clear()
+        for job in self.running:
+            job.cancel()
+        self.done.set()
+
+    # PoolClient 接口
+    def has_ready(self) -> bool:
+        return any(self._runnable(tid) for *_, tid in self.ready)
+
+    def has_blocked(self) -> bool:
+        return bool(self.ready)
+
+    def _runnable(self, task_id: str) -> bool:
+        return self.pool.resources.available(self.tasks[task_id].resources, self.resource_limits)
+
+    def take(self):
+        """取出资源可用的最高优先级任务并占用其资源，跳过的任务放回就绪队列"""
+        deferred = []
         while True:
-            try:
-                task_id = await self.queue.get()
-                task = self.tasks[task_id]
-                task.status = TaskStatus.RUNNING
-
-                # 执行任务
-                payload = {
-                    "objective": task.objective,
-                    "instructions": task.instructions,
-                    "context": self.context,
-                    "constraints": task.constraints,
-                    "acceptance_criteria": task.acceptance_criteria,
-                }
-                result = await self.executor_fn(payload)
-                task.result = result
-                task.status = (
-                    TaskStatus.SUCCESS if result.get("status") == "success"
-                    else TaskStatus.FAILED
-                )
-
-                # 更新完成状态并释放依赖
-                async with self.lock:
-                    self.completed.add(task_id)
-                    await self._release_dependents(task_id)
-
-                self.queue.task_done()
-            except asyncio.CancelledError:
+            entry = heapq.heappop(self.ready)
+            if self._runnable(entry[-1]):
                 break
-
-    async def _release_dependents(self, completed_id: str):
-        """释放依赖已完成任务的后续任务"""
-        completed_task = self.tasks[completed_id]
-
-        for task in self.tasks.values():
-            if task.status != TaskStatus.PENDING:
-                continue
-            if completed_id not in task.depends_on:
+            deferred.append(entry)
+        for skipped in deferred:
+            heapq.heappush(self.ready, skipped)
+        self.pool.resources.counters["deferred"] += len(deferred)
+        task = self.tasks[entry[-1]]
+        if self.batching and (members := self._take_batch(task)):
+            return self._run_batch([task, *members])
+        self.pool.resources.acquire(task.resources)
+        return self._run_holding(task)
+
+    def _batch_key(self, task: Task) -> tuple | None:
+        """可合并任务的兼容键（执行选项相同），不可合并时返回 None"""
+        if not task.batch or task.map is not None or task.resources or task.executor == "shell":
+            return None
+        if self.batch_max_cost > 0 and task_weight(task) > self.batch_max_cost:
+            return None
+        return (task.executor, task.read_only, task.hedge, task.coalesce, task.timeout, task.cache)
+
+    def _take_batch(self, first: Task) -> list[Task]:
+        """按优先级从就绪队列中取出可与 first 合并的任务，受任务数和权重预算限制
+
+        就绪任务的依赖都已完成，彼此之间不存在依赖关系。
+        """
+        key = self._batch_key(first)
+        if key is None or self.batch_max_tasks < 2:
+            return []
+        members: list[Task] = []
+        skipped = []
+        cost = task_weight(first)
+        for _ in range(min(BATCH_SCAN, len(self.ready))):
+            entry = heapq.heappop(self.ready)
+            task = self.tasks[entry[-1]]
+            if self._batch_key(task) == key and (self.batch_max_cost <= 0 or cost + task_weight(task) <= self.batch_max_cost):
+                members.append(task)
+                cost += task_weight(task)
+                if len(members) + 1 >= self.batch_max_tasks:
+                    break
+            else:
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.ready, entry)
+        return members
+
+    async def _run_holding(self, task: Task):
+        """执行任务，结束（含取消）后归还资源"""
+        try:
+            return await self._run_task(task.id)
+        finally:
+            if task.resources:
+                self.pool.release_resources(task.resources)
+
+    async def _run_task(self, task_id: str):
+        """在执行池槽位中执行单个任务"""
+        task = self.tasks[task_id]
+        if task.status != TaskStatus.QUEUED:
+            return None  # 出队后、开始前 DAG 已被中止
+        job = asyncio.current_task()
+        self.running.add(job)
+        self._set_status(task, TaskStatus.RUNNING)
+        task.started = time.monotonic()
+
+        # map 任务：无 reduce 时直接汇总分片结果，不调用 executor
+        gather = task.map is not None and (task.map_error is not None or task.reduce is None)
+        payload = self._payload(task)
+        started = time.monotonic()
+        key = cached = None
+        try:
+            if not gather and self.incremental and task.cache:
+                key = await self._memo_key(task, payload)
+                cached = get_task_cache().get(key) if key else None
+            if gather:
+                result = self._gather(task)
+            elif cached:
+                result = {**cached, "cached": True}
+            elif self.isolation:
+                result = await self.isolation.run(task.id, task.read_only, payload, self.executor_fn)
+            else:
+                result = await self.executor_fn(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            result = {"status": "error", "summary": f"Executor raised {type(exc).__name__}: {exc}"}
+        finally:
+            self.running.discard(job)
+            task.finished = time.monotonic()
+
+        if task.shards is not None and not gather:
+            result = {**result, "shards": task.shards}
+        await self._finish(task, result, payload, key, None if cached or gather else time.monotonic() - started)
+        return result
+
+    async def _finish(self, task: Task, result: dict[str, Any], payload: dict[str, Any], key: str | None, duration: float | None):
+        """记录任务结果，释放后续任务；duration 为 None 时（复用或汇总的结果）不记录耗时和缓存"""
+        task.result = {**result, "batch_error": task.batch_error} if task.batch_error else result
+        self._set_status(task, {
+            "success": TaskStatus.SUCCESS,
+            "timeout": TaskStatus.TIMEOUT,
+        }.get(result.get("status"), TaskStatus.FAILED), task.result)
+        if task.status == TaskStatus.SUCCESS and duration is not None:
+            record_duration(task, duration)
+            if key:
+                await self._memoize(task, payload, key, result)
+
+        # 更新完成状态并释放依赖
+        self._complete(task.id)
+        if self.fail_fast and task.status != TaskStatus.SUCCESS:
+            self._abort(TaskStatus.CANCELLED)
+        if self.on_progress:
+            await self.on_progress(len(self.completed), len(self.tasks))
+
+    async def _run_batch(self, members: list[Task]):
+        """合并执行一批任务：先查缓存，其余任务合成一个提示词执行一次，再按任务拆分结果
+
+        没有拆出结果的任务（含整批执行失败、worktree 合并失败）重新入队单独执行，
+        避免一个任务的问题拖累同批其他任务。
+        """
+        members = [t for t in members if t.status == TaskStatus.QUEUED]
+        if len(members) <= 1:
+            return await self._run_task(members[0].id) if members else None
+        job = asyncio.current_task()
+        self.running.add(job)
+        for task in members:
+            self._set_status(task, TaskStatus.RUNNING)
+            task.started = time.monotonic()
+
+        payloads = {task.id: self._payload(task) for task in members}
+        keys: dict[str, str | None] = {}
+        results: dict[str, dict[str, Any]] = {}
+        reused: set[str] = set()
+        ids: list[str] = []
+        outcome = None
+        started = time.monotonic()
+        try:
+            if self.incremental and members[0].cache:
+                cache = get_task_cache()
+                for task in members:
+                    keys[task.id] = await self._memo_key(task, payloads[task.id])
+                    if keys[task.id] and (hit := cache.get(keys[task.id])):
+                        results[task.id] = {**hit, "cached": True}
+                        reused.add(task.id)
+            ids = [task.id for task in members if task.id not in results]
+            if ids:
+                combined = batch_payload({tid: payloads[tid] for tid in ids})
+                if self.isolation:
+                    outcome = await self.isolation.run("batch " + " ".join(ids), members[0].read_only, combined, self.executor_fn)
+                else:
+                    outcome = await self.executor_fn(combined)
+                merge = outcome.get("merge")
+                if not merge or merge.get("status") not in ("conflict", "error"):
+                    for tid, result in split_batch_result(outcome, ids).items():
+                        results[tid] = {**result, "batch": ids, **({"merge": merge} if merge else {})}
+                self.batches.append(ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # 整批执行异常：记录原因，全部任务单独重试
+            error = f"Batch execution failed: {type(exc).__name__}: {exc}"
+            for task in members:
+                if task.id not in results:
+                    task.batch_error = error
+            if self.journal:
+                self.journal.batch_error([task.id for task in members if task.id not in results], error)
+        finally:
+            self.running.discard(job)
+
+        duration = (time.monotonic() - started) / max(len(ids), 1)
+        retry = []
+        for task in members:
+            if task.status != TaskStatus.RUNNING:
+                continue  # 执行期间 DAG 已被中止
+            if task.id not in results:
+                task.batch = False
+                task.started = None
+                retry.append(task.id)
                 continue
+            task.finished = time.monotonic()
+            await self._finish(task, results[task.id], payloads[task.id], keys.get(task.id), None if task.id in reused else duration)
+        for tid in retry:
+            if self.tasks[tid].status == TaskStatus.RUNNING:
+                self._enqueue(tid)
+        if retry and self.ready:
+            self.pool.notify(self)
+        return outcome  # 执行池按整批结果调整自适应并发
+
+    def _payload(self, task: Task) -> dict[str, Any]:
+        """构建 executor 的任务参数；已展开的 map 任务使用 reduce 定义，并附上各分片的结果摘要"""
+        spec: dict[str, Any] = {
+            "objective": task.objective,
+            "instructions": task.instructions,
+            "constraints": task.constraints,
+            "acceptance_criteria": task.acceptance_criteria,
+        }
+        if task.reduce is not None:
+            spec = {k: task.reduce.get(k, [] if k in ("constraints", "acceptance_criteria") else "") for k in spec}
+            lines = [f"- {sid} [{self.tasks[sid].status.value}]: {_clip(self.tasks[sid].result.get('summary'))}" for sid in task.shards or []]
+            spec["instructions"] = "\n".join(filter(None, [spec["instructions"], "Shard results:", *lines]))
+
+        context = self.context
+        if task.files_of_interest:
+            shared = context.get("files_of_interest") or []
+            context = {**context, "files_of_interest": [*shared, *task.files_of_interest]}
+        payload = {**spec, "context": context}
+        if task.timeout:
+            payload["timeout"] = task.timeout
+        if task.read_only:
+            payload["read_only"] = True
+            payload["hedge"] = task.hedge
+        if task.coalesce is not None:
+            payload["coalesce"] = task.coalesce
+        executor, command = task.executor, task.command
+        if task.reduce is not None:
+            executor, command = task.reduce.get("executor") or "droid", task.reduce.get("command")
+        if executor != "droid":
+            payload["executor"] = executor
+        if command is not None:
+            payload["command"] = command
+        return payload
+
+    def _gather(self, task: Task) -> dict[str, Any]:
+        """汇总 map 任务的分片结果（展开失败时返回错误）"""
+        shards = task.shards or []
+        results = [self.tasks[sid].result for sid in shards]
+        files = {}
+        for result in results:
+            for change in result.get("files_changed") or []:
+                files.setdefault(change.get("path"), change)
+        return {
+            "status": "error" if task.map_error else "success",
+            "summary": task.map_error or f"{len(shards)} shards completed",
+            "shards": shards,
+            "files_changed": list(files.values()),
+            "commands_run": [c for r in results for c in r.get("commands_run") or []],
+            "tests": {},
+            "logs": [],
+            "issues": [i for r in results for i in r.get("issues") or []],
+        }
 
-            # 检查是否所有依赖都完成
-            all_deps_done = all(d in self.completed for d in task.depends_on)
-            any_dep_failed = any(
-                self.tasks[d].status in (TaskStatus.FAILED, TaskStatus.SKIPPED, TaskStatus.TIMEOUT)
-                for d in task.depends_on
+    def _expand(self, task: Task):
+        """展开 map 任务：解析条目、分块并创建分片任务，本任务在全部分片结束后才就绪"""
+        task.shards = []
+        if self.isolation and self.isolation.workdir:
+            root = self.isolation.workdir
+        else:
+            root = self.context.get("repo_root") or os.getcwd()
+        try:
+            upstream = self.tasks[task.map["from"]].result if task.map.get("from") else None
+            chunks = chunked(map_items(task.map, root, upstream), task.map["chunk_size"])
+            if len(chunks) > DROID_MAP_MAX_SHARDS:
+                raise ValueError(f"{len(chunks)} shards exceed DROID_MAP_MAX_SHARDS ({DROID_MAP_MAX_SHARDS}); raise chunk_size")
+            ids = [f"{task.id}[{i}]" for i in range(len(chunks))]
+            if clash := next((sid for sid in ids if sid in self.tasks), None):
+                raise ValueError(f"Shard id '{clash}' collides with an existing task")
+        except (ValueError, OSError) as exc:
+            task.map_error = f"Map expansion failed: {exc}"
+            return
+
+        listed = lists_items(task.map["chunk_size"], task.objective, task.instructions)
+        for sid, items in zip(ids, chunks):
+            instructions = render(task.instructions, items)
+            if not listed:
+                instructions = "\n".join(filter(None, [instructions, "Items: " + ", ".join(items)]))
+            self.tasks[sid] = Task(
+                id=sid,
+                objective=render(task.objective, items),
+                instructions=instructions,
+                depends_on=list(task.depends_on),
+                constraints=task.constraints,
+                acceptance_criteria=task.acceptance_criteria,
+                estimated_cost=task.estimated_cost,
+                priority=task.priority,
+                timeout=task.timeout,
+                read_only=task.read_only,
+                hedge=task.hedge,
+                coalesce=task.coalesce,
+                files_of_interest=[*task.files_of_interest, *(items if task.map["as_files"] else [])],
+                cache=task.cache,
+                resources=task.resources,
+                batch=task.batch,
+                executor=task.executor,
+                command=render_command(task.command, items) if task.command is not None else None,
+                group=task.id,
             )
-
-            if any_dep_failed:
-                task.status = TaskStatus.SKIPPED
-                self.completed.add(task.id)
-            elif all_deps_done:
-                task.status = TaskStatus.QUEUED
-                await self.queue.put(task.id)
-
-    async def _wait_all(self):
-        """等待所有任务完成"""
-        while len(self.completed) < len(self.tasks):
-            await asyncio.sleep(0.1)
+            self.dependents[sid] = [task.id]
+            self.ranks[sid] = self.ranks.get(task.id, 0.0)
+            self.remaining[task.id] += 1
+            task.shards.append(sid)
+        for sid in ids:
+            self._enqueue(sid)
+
+    async def _memo_key(self, task: Task, payload: dict[str, Any]) -> str | None:
+        """计算任务的缓存键；输入无法确定（未声明文件且不在 git 仓库中）时返回 None"""
+        context = payload["context"] or {}
+        fingerprint = await fingerprint_inputs(context.get("repo_root"), context.get("files_of_interest") or [])
+        if fingerprint is None:
+            return None
+        definition = {k: payload.get(k) for k in ("objective", "instructions", "context", "constraints", "acceptance_criteria", "read_only")}
+        definition.update({k: payload[k] for k in ("executor", "command") if k in payload})
+        upstream = {dep: self.tasks[dep].result for dep in [*task.depends_on, *(task.shards or [])]}
+        return task_key(definition, upstream, fingerprint)
+
+    async def _memoize(self, task: Task, payload: dict[str, Any], key: str, result: dict[str, Any]):
+        """保存成功结果。
+
+        任务修改了输入时同时按执行后的输入保存：下次运行时仓库已处于该任务产出的状态，
+        任务本身和依赖它的任务都能命中缓存。
+        """
+        cache = get_task_cache()
+        cache.put(key, task.id, result)
+        if not task.read_only and (after := await self._memo_key(task, payload)) and after != key:
+            cache.put(after, task.id, result)
+
+    def _enqueue(self, task_id: str):
+        """就绪任务入队：显式 priority 优先，其次关键路径更长者，最后按入队顺序
+
+        map 任务首次就绪时先展开为分片，等分片全部结束后再次就绪并入队
+        """
+        task = self.tasks[task_id]
+        if task.map is not None and task.shards is None:
+            self._expand(task)
+            if self.remaining[task_id]:
+                return
+        self._set_status(task, TaskStatus.QUEUED)
+        self._seq += 1
+        heapq.heappush(self.ready, (-(task.priority or 0), -self.ranks.get(task_id, 0.0), self._seq, task_id))
+
+    def _complete(self, task_id: str):
+        """标记任务结束，沿反向依赖索引释放或跳过后续任务（每条边 O(1)）"""
+        stack = [task_id]
+        while stack:
+            tid = stack.pop()
+            self.completed.add(tid)
+            succeeded = self.tasks[tid].status == TaskStatus.SUCCESS
+            for dependent_id in self.dependents[tid]:
+                dependent = self.tasks[dependent_id]
+                if dependent.status != TaskStatus.PENDING:
+                    continue
+                if not succeeded:
+                    # 依赖失败，跳过并继续向下传播；分片失败时其 map 任务记为失败
+                    if self.tasks[tid].group == dependent_id:
+                        dependent.result = {**self._gather(dependent), "status": "failed", "summary": f"Shard '{tid}' {self.tasks[tid].status.value}"}
+                        self._set_status(dependent, TaskStatus.FAILED, dependent.result)
+                    else:
+                        self._set_status(dependent, TaskStatus.SKIPPED)
+                    stack.append(dependent_id)
+                    continue
+                self.remaining[dependent_id] -= 1
+                if not self.remaining[dependent_id]:
+                    self._enqueue(dependent_id)
+
+        if self.ready:
+            self.pool.notify(self)
+        if len(self.completed) == len(self.tasks):
+            self.done.set()
 
     def _build_result(self, duration: float) -> dict[str, Any]:
         """构建返回结果"""
         results = {}
         skipped = []
         failed = []
+        cancelled = []
+        cached = []
+        resumed = []
 
         for task in self.tasks.values():
             results[task.id] = task.result or {"status": task.status.value}
+            if task.result.get("cached"):
+                cached.append(task.id)
+            if task.result.get("resumed"):
+                resumed.append(task.id)
             if task.status == TaskStatus.SKIPPED:
                 skipped.append(task.id)
             elif task.status in (TaskStatus.FAILED, TaskStatus.TIMEOUT):
                 failed.append(task.id)
+            elif task.status == TaskStatus.CANCELLED:
+                cancelled.append(task.id)
 
-        all_success = not skipped and not failed
+        all_success = not skipped and not failed and not cancelled
         has_success = any(t.status == TaskStatus.SUCCESS for t in self.tasks.values())
 
-        if all_success:
+        if self.timed_out:
+            status = "timeout"
+        elif self.cancelled:
+            status = "cancelled"
+        elif all_success:
             status = "completed"
         elif has_success:
             status = "partial"
@@ -214,4 +802,8 @@ class DAGScheduler:
             "results": results,
             "skipped": skipped,
             "failed": failed,
+            "cancelled": cancelled,
+            "cached": cached,
+            "resumed": resumed,
+            "batches": self.batches,
         }
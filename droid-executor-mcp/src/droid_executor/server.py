@@ -1,11 +1,32 @@
 """Droid Executor MCP Server - Implementation-focused coding agent powered by Droid CLI"""
-from mcp.server.fastmcp import FastMCP
+import os
+
+from mcp.server.fastmcp import Context, FastMCP
+from .batching import DROID_BATCH
 from .droid_client import call_droid_async
+from .executors import run_task
+from .hedging import get_hedger
+from .journal import DROID_JOURNAL, RunJournal, list_runs, load_run, new_run_id
+from .memo import DROID_DAG_CACHE, get_task_cache
+from .pool import get_pool
+from .ratelimit import get_limiter
+from .resources import check_limits
+from .runs import get_runs
 from .scheduler import DAGScheduler
+from .singleflight import get_flights
+from .worktrees import DROID_ISOLATION, WorktreeIsolation, worktree_stats
 
 mcp = FastMCP("droid-executor")
 
 
+async def _report_progress(ctx: Context, progress: float, total: float | None = None):
+    """发送 MCP 进度通知；客户端未请求进度或已断开时忽略"""
+    try:
+        await ctx.report_progress(progress, total)
+    except Exception:
+        pass
+
+
 @mcp.tool()
 async def execute_droid_task(
     objective: str,
@@ -13,6 +34,10 @@ async def execute_droid_task(
     context: dict | None = None,
     constraints: list[str] | None = None,
     acceptance_criteria: list[str] | None = None,
+    read_only: bool = False,
+    hedge: bool | None = None,
+    coalesce: bool | None = None,
+    ctx: Context = None,
 ) -> dict:
     """
     委托编码任务给 Droid Executor 执行。
@@ -32,6 +57,10 @@ async def execute_droid_task(
             - summary: 背景摘要
         constraints: 约束条件列表(如 "不修改测试文件", "保持向后兼容")
         acceptance_criteria: 验收标准列表(如 "所有测试通过", "代码符合规范")
+        read_only: 只读任务(分析、审查等),只启用 LS/Read/Glob/Grep 工具
+        hedge: 只读任务是否对冲慢执行(默认 DROID_HEDGE),超过近期延迟分位数时再启动一次,先成功者胜出
+        coalesce: 是否与进行中的相同任务(同一仓库、相同提示词)共享执行(默认 DROID_SINGLE_FLIGHT),
+            有副作用且需要重复执行时传 False
 
     Returns:
         执行结果字典,包含:
@@ -42,26 +71,49 @@ async def execute_droid_task(
         - tests: 测试结果(passed, details)
         - logs: 执行日志
         - issues: 发现的问题列表(type, description, suggested_action)
+
+    执行期间每解析到一个 Droid 输出事件发送一次 MCP 进度通知。
     """
-    return await call_droid_async({
+    events = 0
+
+    async def on_event(event: dict):
+        nonlocal events
+        events += 1
+        if ctx:
+            await _report_progress(ctx, events)
+
+    return await get_pool().run(call_droid_async, {
         "objective": objective,
         "instructions": instructions,
         "context": context,
         "constraints": constraints,
         "acceptance_criteria": acceptance_criteria,
-    })
+        "read_only": read_only,
+        "hedge": hedge,
+        "coalesce": coalesce,
+    }, on_event)
 
 
 @mcp.tool()
 async def execute_dag(
-    tasks: list[dict],
+    tasks: list[dict] | None = None,
     context: dict | None = None,
+    fail_fast: bool = False,
+    incremental: bool | None = None,
+    resume_run_id: str | None = None,
+    isolation: str | None = None,
+    resource_limits: dict[str, int] | None = None,
+    batch: bool | None = None,
+    ctx: Context = None,
 ) -> dict:
     """
     并行执行 DAG 任务图。
 
     支持任务依赖声明,自动拓扑排序,并行执行无依赖任务。
-    最大并发数: 8, 单任务超时: 30分钟, 整体超时: 60分钟。
+    就绪任务默认按关键路径(最长剩余路径)优先调度。
+    所有 DAG 与单任务共享进程级执行池(最大并发数: 8),在并发的 DAG 之间轮转分配;
+    单任务超时: 30分钟, 整体超时: 60分钟。超时、fail_fast 或调用方断开时会终止所有运行中的 droid 进程。
+    每个任务结束时发送 MCP 进度通知(已结束任务数 / 总任务数)。
 
     Args:
         tasks: 任务列表,每个任务包含:
@@ -71,9 +123,49 @@ async def execute_dag(
             - depends_on: 依赖的任务ID列表(可选,默认无依赖)
             - constraints: 约束条件列表(可选)
             - acceptance_criteria: 验收标准列表(可选)
+            - estimated_cost: 预估耗时(可选),用于关键路径优先调度
+            - priority: 显式优先级(可选),越大越先执行
+            - timeout: 单任务超时秒数(可选,默认 DROID_TIMEOUT)
+            - read_only: 只读任务(可选),只启用只读工具
+            - hedge: 只读任务是否对冲慢执行(可选,默认 DROID_HEDGE)
+            - coalesce: 是否与进行中的相同任务合并执行(可选,默认 DROID_SINGLE_FLIGHT)
+            - files_of_interest: 任务自身的输入文件(可选),追加到共享上下文,增量执行时按其内容判断是否变化
+            - cache: 增量执行时是否允许复用缓存结果(可选,默认 True)
+            - resources: 资源标签列表(可选),如 ["exclusive:repo-write", "port:8080"]。
+              占用同一资源的任务数不超过其容量(默认 1,即互斥),资源被占满的就绪任务让位给其他就绪任务
+            - map: 任务模板(可选),依赖完成时展开为分片任务 "<id>[0]", "<id>[1]"...:
+                - items / glob / from: 条目来源三选一——列表、相对 repo_root 的 glob(支持 **),
+                  或 depends_on 中某个任务的结果(其 items 字段,没有时取 files_changed)
+                - chunk_size: 每个分片处理的条目数(默认 DROID_MAP_CHUNK_SIZE)
+                - as_files: 是否把条目加入分片的 files_of_interest(glob/from 默认 True)
+              objective/instructions 中的 {items} 替换为分片的全部条目,{item} 替换为首个条目;
+              其余字段应用于每个分片。依赖该任务的下游在全部分片成功后才开始
+            - reduce: 分片全部成功后执行的汇总任务(可选,仅 map 任务),包含 objective/instructions 等,
+              指令末尾附上各分片的结果摘要,可指定 executor/command;没有 reduce 时该任务直接汇总分片结果
+            - batch: 启用合并执行时是否允许与其他任务合并(可选,默认 True)
+            - executor: 执行后端(可选,默认 "droid"):
+                - "droid": Droid CLI
+                - "codex": Codex CLI(codex exec,只读任务用 read-only 沙箱,否则 workspace-write)
+                - "shell": 在 repo_root 中直接运行 command,退出码 0 为成功,不经过模型、不占模型限额
+              所有后端返回相同格式的结果
+            - command: shell 后端运行的命令,字符串经 /bin/sh 执行,列表直接作为参数执行;
+              map 任务中 {items}/{item} 会被替换(字符串中自动 shell 转义,列表中单独的 "{items}" 展开为多个参数)
         context: 共享上下文,应用于所有任务:
             - repo_root: 仓库根目录
             - files_of_interest: 相关文件列表
+        fail_fast: 首个任务失败时立即取消整个 DAG(默认 False)
+        incremental: 增量执行(默认 DROID_DAG_CACHE)。任务定义、上游结果和输入文件
+            (files_of_interest 的内容,未声明时为整个工作区的 git tree)都未变化时直接返回上次成功的结果
+        resume_run_id: 恢复中断(服务重启、超时等)的运行。只重新执行未成功的任务;
+            未提供 tasks/context 时使用该运行记录的任务和上下文,提供时只复用定义未变化的任务结果
+        isolation: 任务隔离模式(默认 DROID_ISOLATION)。"worktree" 时每个任务在独立的 git worktree 中执行,
+            成功后提交并按依赖顺序合并,DAG 结束时把合并结果应用回 repo_root 工作区;
+            合并冲突的任务标记为失败,result["merge"] 中列出冲突文件
+        resource_limits: 资源容量(可选),如 {"gpu-free-cpu-heavy": 2},覆盖 DROID_RESOURCE_LIMITS。
+            资源在整个服务内共享,并发的 DAG 中声明同一资源的任务也会互相让位
+        batch: 合并执行小任务(默认 DROID_BATCH)。执行选项相同、未声明 resources 的就绪任务
+            (最多 DROID_BATCH_MAX_TASKS 个,权重之和不超过 DROID_BATCH_MAX_COST)合成一个提示词由一次 droid 调用完成,
+            再按任务拆分结果(结果中带 batch 字段);没有拆出结果或整批失败的任务单独重新执行
 
     Returns:
         执行结果字典:
@@ -81,24 +173,229 @@ async def execute_dag(
         - duration_ms: 总执行时间(毫秒)
         - results: {task_id: task_result} 映射
         - skipped: 因依赖失败而跳过的任务ID列表
-        - failed: 执行失败的任务ID列表
+        - failed: 执行失败或超时的任务ID列表
+        - cancelled: 因 fail_fast 或调用方取消而中止的任务ID列表
+        - cached: 复用缓存结果的任务ID列表(结果中带 cached: true)
+        - resumed: 恢复运行时沿用上次成功结果的任务ID列表
+        - run_id: 运行 ID(启用 DROID_JOURNAL 或恢复运行时),可用于 resume_run_id
+        - isolation: worktree 模式下的合并结果(base, head, applied, error)
+        - batches: 合并执行过的任务组
 
     Example:
+        # lint 总以 0 退出，报告交给 fix 处理；typecheck 作为门禁，失败时跳过 build
         result = execute_dag(
             tasks=[
-                {"id": "lint", "objective": "运行 lint 检查"},
-                {"id": "typecheck", "objective": "运行类型检查"},
-                {"id": "test", "objective": "运行测试", "depends_on": ["lint", "typecheck"]},
-                {"id": "build", "objective": "构建项目", "depends_on": ["test"]},
+                {"id": "lint", "executor": "shell", "command": "ruff check --exit-zero ."},
+                {"id": "typecheck", "executor": "shell", "command": "mypy src"},
+                {"id": "fix", "objective": "修复 lint 报告的问题", "depends_on": ["lint"]},
+                {"id": "build", "objective": "构建项目", "depends_on": ["fix", "typecheck"]},
             ],
             context={"repo_root": "."}
         )
     """
+    async def on_progress(done: int, total: int):
+        if ctx:
+            await _report_progress(ctx, done, total)
+
+    prepared = _prepare_dag(tasks, context, fail_fast, incremental, resume_run_id, isolation, resource_limits, batch, on_progress)
+    if isinstance(prepared, dict):
+        return prepared
+    scheduler, tasks, restored = prepared
+    return await scheduler.submit(tasks, restored)
+
+
+def _prepare_dag(tasks, context, fail_fast, incremental, resume_run_id, isolation, resource_limits, batch, on_progress=None):
+    """解析任务（恢复运行时从运行日志读取）并创建调度器
+
+    返回 (scheduler, tasks, restored)；无需执行（空 DAG）或 run_id 无效时返回结果字典。
+    """
+    journal = restored = None
+    if resume_run_id:
+        run = load_run(resume_run_id)
+        if run is None:
+            return {"status": "failed", "error": f"Unknown run id: '{resume_run_id}'", "results": {}, "skipped": [], "failed": []}
+        tasks = tasks or run.tasks
+        context = context or run.context
+        restored = run.restorable(tasks)
+        journal = RunJournal(resume_run_id)
+    elif DROID_JOURNAL and tasks:
+        journal = RunJournal(new_run_id())
+
     if not tasks:
-        return {"status": "completed", "duration_ms": 0, "results": {}, "skipped": [], "failed": []}
+        return {
+            "status": "completed", "duration_ms": 0, "results": {},
+            "skipped": [], "failed": [], "cancelled": [], "cached": [], "resumed": [],
+        }
+
+    isolation = isolation or DROID_ISOLATION
+    if isolation not in ("none", "worktree"):
+        return {"status": "failed", "error": f"Unknown isolation mode: '{isolation}'", "results": {}, "skipped": [], "failed": []}
+    try:
+        resource_limits = check_limits(resource_limits or {})
+    except ValueError as exc:
+        return {"status": "failed", "error": str(exc), "results": {}, "skipped": [], "failed": []}
+    context = context or {}
+    worktrees = WorktreeIsolation(context.get("repo_root") or os.getcwd()) if isolation == "worktree" else None
+
+    scheduler = DAGScheduler(
+        run_task, context, fail_fast=fail_fast, on_progress=on_progress,
+        incremental=DROID_DAG_CACHE if incremental is None else incremental,
+        journal=journal, isolation=worktrees, resource_limits=resource_limits,
+        batching=DROID_BATCH if batch is None else batch,
+    )
+    return scheduler, tasks, restored
+
+
+@mcp.tool()
+async def start_dag(
+    tasks: list[dict] | None = None,
+    context: dict | None = None,
+    fail_fast: bool = False,
+    incremental: bool | None = None,
+    resume_run_id: str | None = None,
+    isolation: str | None = None,
+    resource_limits: dict[str, int] | None = None,
+    batch: bool | None = None,
+) -> dict:
+    """
+    在后台启动 DAG 运行并立即返回 run_id。
+
+    参数与 execute_dag 相同。运行在服务进程中继续执行,调用方可以先处理其他工作,
+    再用 get_dag_status 轮询进度、get_task_result 取已完成任务的结果、cancel_dag 取消。
 
-    scheduler = DAGScheduler(call_droid_async, context or {})
-    return await scheduler.submit(tasks)
+    Returns:
+        - run_id: 运行 ID
+        - status: "running"(空 DAG 或 run_id 无效时直接返回 execute_dag 的结果)
+        - tasks: 任务数
+    """
+    runs = get_runs()
+    if resume_run_id and (status := runs.status(resume_run_id)) and status["status"] == "running":
+        return {"status": "failed", "error": f"Run '{resume_run_id}' is still running", "run_id": resume_run_id}
+
+    prepared = _prepare_dag(tasks, context, fail_fast, incremental, resume_run_id, isolation, resource_limits, batch)
+    if isinstance(prepared, dict):
+        return prepared
+    scheduler, tasks, restored = prepared
+    run_id = scheduler.journal.run_id if scheduler.journal else new_run_id()
+    runs.start(run_id, scheduler, tasks, restored)
+    return {"run_id": run_id, "status": "running", "tasks": len(tasks)}
+
+
+@mcp.tool()
+def get_dag_status(run_id: str) -> dict:
+    """
+    查询 DAG 运行进度。
+
+    Args:
+        run_id: start_dag 或 execute_dag 返回的运行 ID
+
+    Returns:
+        - status: "running" 或最终状态("completed", "partial", "failed", "timeout", "cancelled")
+        - elapsed_ms: 已运行时间(毫秒)
+        - tasks: {task_id: {status, elapsed_ms, reused}} 每个任务的状态和耗时(reused 表示复用缓存或恢复的结果)
+        - counts: 各状态的任务数
+        - queue_depth: 已就绪、等待执行池槽位的任务数
+        - resource_blocked: 就绪任务中因资源被占满而等待的任务数
+        - running: 运行中的任务数
+        运行结束后另含 skipped, failed, cancelled, cached, resumed, duration_ms。
+        服务重启前的运行只能从运行日志读取任务状态,中断的运行 status 为 "interrupted",可用 resume_run_id 恢复。
+    """
+    return get_runs().status(run_id) or {"error": f"Unknown run id: '{run_id}'"}
+
+
+@mcp.tool()
+def get_task_result(run_id: str, task_id: str) -> dict:
+    """
+    获取 DAG 运行中单个任务的结果,可在整个 DAG 结束前逐个取回已完成的任务。
+
+    Args:
+        run_id: 运行 ID
+        task_id: 任务 ID
+
+    Returns:
+        - status: 任务状态
+        - result: 任务结束后的执行结果(与 execute_droid_task 的返回相同),未结束时不含该字段
+    """
+    return get_runs().task_result(run_id, task_id) or {"error": f"Unknown run or task: '{run_id}' / '{task_id}'"}
+
+
+@mcp.tool()
+def cancel_dag(run_id: str) -> dict:
+    """
+    取消后台运行的 DAG。运行中的 droid 进程组会被终止,未开始的任务标记为 cancelled。
+
+    Args:
+        run_id: 运行 ID
+
+    Returns:
+        - cancelled: 是否执行了取消(运行不存在或已结束时为 False)
+    """
+    return {"run_id": run_id, "cancelled": get_runs().cancel(run_id)}
+
+
+@mcp.tool()
+def list_dag_runs(limit: int = 20) -> list[dict]:
+    """
+    列出最近的 DAG 运行记录,用于查找可恢复的运行。
+
+    Args:
+        limit: 返回条数(默认 20)
+
+    Returns:
+        运行摘要列表(按最近更新排序): run_id, status("interrupted" 表示未正常结束),
+        tasks(任务数), task_statuses(各状态任务数), started, updated
+    """
+    return list_runs(limit=limit)
+
+
+@mcp.tool()
+def get_execution_stats() -> dict:
+    """
+    查看执行池和进行中任务合并的统计信息。
+
+    Returns:
+        pool: capacity, running, waiting_clients(adaptive 模式下含 adaptive)
+            resource_blocked_clients: 就绪任务都在等待资源的调用方数
+            resources: 资源占用(in_use)、容量配置(limits)、因资源被跳过的出队次数(deferred)
+        single_flight: executions, coalesced(被合并的调用数), in_flight
+        rate_limit: 主机级限流状态(rpm, max_sessions, host_sessions)和排队等待时间
+            (waiting, queued, wait_seconds, max_wait_seconds, avg_wait_seconds)
+        task_cache: 增量执行缓存(hits, misses, stores, evictions, hit_rate, entries, max_entries)
+        worktrees: 每个仓库的 worktree 池(idle, total, max_idle)
+    """
+    return {
+        "pool": get_pool().stats(),
+        "single_flight": get_flights().stats(),
+        "rate_limit": get_limiter().stats(),
+        "task_cache": get_task_cache().stats(),
+        "worktrees": worktree_stats(),
+    }
+
+
+@mcp.tool()
+def clear_dag_cache(task_id: str | None = None) -> dict:
+    """
+    清除增量执行的任务结果缓存。
+
+    Args:
+        task_id: 只清除该任务 ID 的缓存(可选,默认全部清除)
+
+    Returns:
+        removed: 删除的缓存条数
+    """
+    return {"removed": get_task_cache().clear(task_id)}
+
+
+@mcp.tool()
+def get_droid_hedge_stats() -> dict:
+    """
+    查看只读任务对冲执行的统计信息(本进程计数)。
+
+    Returns:
+        calls, hedges_fired, hedge_wins, fire_rate, win_rate,
+        threshold_seconds(当前对冲阈值), samples(延迟样本数), percentile
+    """
+    return get_hedger().stats()
 
 
 def main():
@@ -0,0 +1,70 @@
+"""Single-flight - 合并进行中的相同调用，共享同一次执行的结果"""
+import asyncio
+import copy
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class SingleFlight:
+    """按键合并并发调用 - 同一键只执行一次，所有等待者拿到结果副本。
+
+    调用方取消时只是离开等待；最后一个等待者离开时才取消执行，并等执行结束（子进程已终止）后再传播取消。
+    """
+
+    def __init__(self):
+        self.flights: dict[str, _Flight] = {}
+        self.counters = {"executions": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        flight = self.flights.get(key)
+        follower = flight is not None
+        if follower:
+            self.counters["coalesced"] += 1
+        else:
+            flight = self.flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.counters["executions"] += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+                await asyncio.gather(flight.task, return_exceptions=True)
+            raise
+        except BaseException:
+            flight.waiters -= 1
+            raise
+        flight.waiters -= 1
+
+        result = copy.deepcopy(result)
+        if follower:
+            result["coalesced"] = True
+        return result
+
+    def _forget(self, key: str, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.counters, "in_flight": len(self.flights)}
+
+
+_flights: SingleFlight | None = None
+
+
+def get_flights() -> SingleFlight:
+    """获取进程级 single-flight 实例。"""
+    global _flights
+    if _flights is None:
+        _flights = SingleFlight()
+    return _flights
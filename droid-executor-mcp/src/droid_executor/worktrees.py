@@ -0,0 +1,259 @@
+"""Worktree isolation - 每个 DAG 任务在独立的 git worktree 中执行，完成后按依赖顺序合并回仓库"""
+import asyncio
+import fcntl
+import os
+import shutil
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from .gitutil import git_output, run_git, worktree_tree
+from .pool import MAX_WORKERS
+
+# 环境变量配置
+DROID_ISOLATION = os.getenv("DROID_ISOLATION", "none")  # DAG 任务隔离模式: none, worktree
+DROID_WORKTREE_POOL_SIZE = int(os.getenv("DROID_WORKTREE_POOL_SIZE", str(MAX_WORKERS + 1)))  # 每个仓库保留的空闲 worktree 上限
+
+WORKTREE_DIR = "droid-worktrees"  # 位于 git common dir 下，不出现在工作区中
+GIT_IDENTITY = ["-c", "user.name=droid-executor", "-c", "user.email=droid-executor@localhost"]
+
+
+class WorktreePool:
+    """单个仓库的 worktree 池 - 复用已创建的 detached worktree，取出时切换到指定提交并清理。
+
+    同一仓库可能同时有多个服务进程：每个 worktree 旁有一个 .lock 文件，持有者进程对其加 flock 排他锁
+    直到移除该 worktree，进程退出后锁自动释放，其 worktree 才能被其他进程接管或清除。
+    """
+
+    def __init__(self, repo_root: str, common_dir: str, max_idle: int = DROID_WORKTREE_POOL_SIZE):
+        self.repo_root = repo_root
+        self.directory = Path(common_dir, WORKTREE_DIR)
+        self.max_idle = max_idle
+        self.idle: deque[str] = deque()
+        self.total = 0
+        self._lock = asyncio.Lock()  # git worktree add/remove 会修改共享的 worktree 元数据
+        self._discovered = False
+        self._owned: dict[str, int] = {}  # 本进程持有的 worktree -> 锁文件描述符
+
+    def _try_own(self, path: str) -> bool:
+        """对 worktree 的锁文件加非阻塞排他锁，成功时本进程持有该 worktree 直到移除；已被其他进程持有时返回 False。"""
+        lock_path = path + ".lock"
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # 原持有者移除 worktree 时会删除锁文件，此时锁住的是已失效的文件
+            if os.fstat(fd).st_ino != os.stat(lock_path).st_ino:
+                raise FileNotFoundError(lock_path)
+        except OSError:
+            os.close(fd)
+            return False
+        self._owned[path] = fd
+        return True
+
+    def _disown(self, path: str):
+        fd = self._owned.pop(path, None)
+        if fd is not None:
+            try:
+                os.unlink(path + ".lock")
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    async def _discover(self):
+        """接管已退出进程留下的 worktree，清除失效的登记；其他进程持有的 worktree 保持不动。"""
+        self._discovered = True
+        await run_git(self.repo_root, "worktree", "prune")
+        listing = await git_output(self.repo_root, "worktree", "list", "--porcelain") or ""
+        registered = {line.split(" ", 1)[1] for line in listing.splitlines() if line.startswith("worktree ")}
+        if not self.directory.exists():
+            return
+        names = {entry.name.removesuffix(".lock") for entry in self.directory.iterdir()}
+        for name in sorted(names):
+            path = str(self.directory / name)
+            if not self._try_own(path):
+                continue
+            if os.path.isdir(path) and path in registered and len(self.idle) < self.max_idle:
+                self.idle.append(path)
+                self.total += 1
+            else:
+                await self._remove(path, counted=False)
+
+    async def warm(self, count: int, base: str):
+        """预先创建 worktree，使池中至少有 count 个空闲 worktree。"""
+        async with self._lock:
+            if not self._discovered:
+                await self._discover()
+            while len(self.idle) < min(count, self.max_idle):
+                self.idle.append(await self._create(base))
+
+    async def _create(self, base: str) -> str:
+        path = str(self.directory / f"wt-{uuid.uuid4().hex[:8]}")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._try_own(path)
+        code, _, err = await run_git(self.repo_root, "worktree", "add", "--detach", "--force", path, base)
+        if code != 0:
+            self._disown(path)
+            raise RuntimeError(f"git worktree add failed: {err.strip()}")
+        self.total += 1
+        return path
+
+    async def _remove(self, path: str, counted: bool = True):
+        if os.path.isdir(path):
+            code, _, _ = await run_git(self.repo_root, "worktree", "remove", "--force", path)
+            if code != 0:
+                shutil.rmtree(path, ignore_errors=True)
+                await run_git(self.repo_root, "worktree", "prune")
+        self._disown(path)
+        if counted:
+            self.total = max(self.total - 1, 0)
+
+    async def acquire(self, base: str) -> str:
+        """取出一个 worktree 并重置到 base（保留被忽略的构建缓存）。"""
+        async with self._lock:
+            if not self._discovered:
+                await self._discover()
+            path = self.idle.popleft() if self.idle else await self._create(base)
+        for args in (("checkout", "--detach", "--force", "-q", base), ("clean", "-fdq")):
+            code, _, err = await run_git(path, *args)
+            if code != 0:
+                await self.discard(path)
+                raise RuntimeError(f"git {args[0]} failed in worktree: {err.strip()}")
+        return path
+
+    async def release(self, path: str):
+        async with self._lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(path)
+            else:
+                await self._remove(path)
+
+    async def discard(self, path: str):
+        async with self._lock:
+            await self._remove(path)
+
+    def stats(self) -> dict[str, Any]:
+        return {"repo_root": self.repo_root, "idle": len(self.idle), "total": self.total, "max_idle": self.max_idle}
+
+
+_pools: dict[str, WorktreePool] = {}
+
+
+async def get_worktree_pool(repo_root: str) -> WorktreePool:
+    """获取仓库的进程级 worktree 池，repo_root 不在 git 仓库中时抛出 ValueError。"""
+    top = await git_output(repo_root, "rev-parse", "--show-toplevel")
+    common = await git_output(repo_root, "rev-parse", "--git-common-dir")
+    if not top or not common:
+        raise ValueError(f"Worktree isolation requires a git repository: '{repo_root}'")
+    if top not in _pools:
+        _pools[top] = WorktreePool(top, os.path.join(os.path.abspath(repo_root), common))
+    return _pools[top]
+
+
+def worktree_stats() -> list[dict[str, Any]]:
+    return [pool.stats() for pool in _pools.values()]
+
+
+class WorktreeIsolation:
+    """一次 DAG 运行的隔离执行
+
+    DAG 开始时以仓库当前工作区（含未提交改动）为基准创建集成 worktree。
+    每个任务在从池中取出、切换到集成分支最新提交的 worktree 中执行；成功后提交改动并合并进集成 worktree。
+    依赖任务在上游合并后才开始，因此合并顺序天然满足依赖顺序。DAG 结束时把集成结果应用回 repo_root。
+    """
+
+    def __init__(self, repo_root: str):
+        self.repo_root = repo_root
+        self.prefix = ""  # repo_root 相对仓库根目录的路径
+        self.pool: WorktreePool | None = None
+        self.base: str | None = None
+        self.integration: str | None = None
+        self._merge_lock = asyncio.Lock()
+
+    @property
+    def workdir(self) -> str | None:
+        """集成 worktree 中与 repo_root 对应的目录（含已合并的任务改动）"""
+        return os.path.join(self.integration, self.prefix) if self.integration else None
+
+    async def start(self, width: int):
+        """准备基准提交和集成 worktree，并按 DAG 最大并行宽度预热 worktree 池。"""
+        self.pool = await get_worktree_pool(self.repo_root)
+        self.prefix = await git_output(self.repo_root, "rev-parse", "--show-prefix") or ""
+        tree = await worktree_tree(self.repo_root)
+        if not tree:
+            raise ValueError(f"Cannot snapshot working tree of '{self.repo_root}'")
+        parent = await git_output(self.repo_root, "rev-parse", "-q", "--verify", "HEAD")
+        args = ["commit-tree", tree, "-m", "droid-executor: DAG base"]
+        if parent:
+            args[2:2] = ["-p", parent]
+        self.base = await git_output(self.repo_root, *GIT_IDENTITY, *args)
+        if not self.base:
+            raise RuntimeError("git commit-tree failed for DAG base")
+        await self.pool.warm(width + 1, self.base)
+        self.integration = await self.pool.acquire(self.base)
+
+    async def run(self, task_id: str, read_only: bool, payload: dict[str, Any], executor: Callable[[dict], Awaitable[dict]]) -> dict[str, Any]:
+        """在独立 worktree 中执行任务，成功后合并改动；result["merge"] 记录合并情况。"""
+        async with self._merge_lock:
+            head = await git_output(self.integration, "rev-parse", "HEAD")
+        path = await self.pool.acquire(head)
+        try:
+            context = {**(payload.get("context") or {}), "repo_root": os.path.join(path, self.prefix)}
+            result = await executor({**payload, "context": context})
+            if result.get("status") == "success":
+                if read_only:
+                    result["merge"] = {"status": "read_only"}
+                else:
+                    result["merge"] = await self._merge(task_id, path)
+                    if result["merge"]["status"] in ("conflict", "error"):
+                        result["status"] = "failed"
+            return result
+        finally:
+            await self.pool.release(path)
+
+    async def _merge(self, task_id: str, path: str) -> dict[str, Any]:
+        """提交任务 worktree 中的改动并合并进集成 worktree，冲突时放弃合并并报告冲突文件。"""
+        await run_git(path, "add", "-A")
+        if (await run_git(path, "diff", "--cached", "--quiet"))[0] == 0:
+            return {"status": "no_changes"}
+        code, _, err = await run_git(path, *GIT_IDENTITY, "commit", "-q", "--no-verify", "-m", f"droid task {task_id}")
+        if code != 0:
+            return {"status": "error", "error": err.strip()[-2000:]}
+        commit = await git_output(path, "rev-parse", "HEAD")
+
+        async with self._merge_lock:
+            code, _, err = await run_git(
+                self.integration, *GIT_IDENTITY, "merge", "--no-ff", "--no-verify", "-q", "-m", f"merge droid task {task_id}", commit,
+            )
+            if code == 0:
+                return {"status": "merged", "commit": commit}
+            conflicts = (await git_output(self.integration, "diff", "--name-only", "--diff-filter=U") or "").splitlines()
+            await run_git(self.integration, "merge", "--abort")
+        merge = {"status": "conflict", "commit": commit, "conflicts": conflicts}
+        if err.strip():
+            merge["error"] = err.strip()[-2000:]
+        return merge
+
+    async def finish(self) -> dict[str, Any]:
+        """把集成结果应用到 repo_root 工作区并归还集成 worktree。"""
+        if not self.integration:
+            return {"applied": False}
+        try:
+            async with self._merge_lock:
+                head = await git_output(self.integration, "rev-parse", "HEAD")
+                code, diff, err = await run_git(self.integration, "diff", "--binary", self.base, head)
+            info: dict[str, Any] = {"base": self.base, "head": head, "applied": False}
+            if code != 0:
+                info["error"] = err.strip()
+            elif not diff:
+                info["applied"] = True
+            else:
+                code, _, err = await run_git(self.pool.repo_root, "apply", "--binary", "-", input=diff)
+                info["applied"] = code == 0
+                if code != 0:
+                    # 运行期间 repo_root 被改动，集成结果保留在 head 提交中
+                    info["error"] = err.strip()[-2000:]
+            return info
+        finally:
+            await self.pool.release(self.integration)
+            self.integration = None